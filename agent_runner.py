@@ -11,6 +11,7 @@ import json
 import uuid
 import logging
 import asyncio
+import signal
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from socketserver import ThreadingMixIn
 from urllib.parse import urlparse
@@ -93,6 +94,46 @@ def run_async(coro, timeout=300):
     return future.result(timeout=timeout)
 
 
+_BOUNDARY_RE = re.compile(r'boundary=(?:"([^"]+)"|([^;\s]+))', re.I)
+_DISPOSITION_PARAM_RE = re.compile(r'\b(name|filename)="([^"]*)"', re.I)
+
+
+def parse_multipart(content_type: str, body: bytes):
+    """Décoder un body multipart/form-data → (champs texte, fichiers {nom: (filename, bytes)}).
+
+    Découpage sur le délimiteur avec bytes.find : une seule copie par partie, pas de
+    parsing ligne à ligne du contenu (uploads jusqu'à 48 MB).
+    """
+    fields, files = {}, {}
+    m = _BOUNDARY_RE.search(content_type)
+    if not m:
+        return fields, files
+    delim = b"--" + (m.group(1) or m.group(2)).encode("latin-1")
+    pos = body.find(delim)
+    while pos != -1:
+        start = pos + len(delim)
+        if body[start:start + 2] == b"--":
+            break  # délimiteur final
+        head_end = body.find(b"\r\n\r\n", start)
+        end = body.find(b"\r\n" + delim, head_end + 4) if head_end != -1 else -1
+        if end == -1:
+            break
+        params = {}
+        for line in body[start:head_end].decode("utf-8", "replace").split("\r\n"):
+            key, _, value = line.partition(":")
+            if key.strip().lower() == "content-disposition":
+                params = {k.lower(): v for k, v in _DISPOSITION_PARAM_RE.findall(value)}
+        name = params.get("name")
+        if name:
+            payload = body[head_end + 4:end]
+            if "filename" in params:
+                files[name] = (params["filename"], payload)
+            else:
+                fields[name] = payload.decode("utf-8", "replace")
+        pos = end + 2
+    return fields, files
+
+
 class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
     daemon_threads = True
 
@@ -273,6 +314,14 @@ class AgentHandler(BaseHTTPRequestHandler):
             _rate_limits[ip] = (1, now)
         return True
 
+    def _deny_reason(self):
+        """Auth + rate limit (VULN-08) : (erreur, code HTTP) si refusée, None sinon."""
+        if not self._check_auth():
+            return {"error": "Unauthorized"}, 401
+        if not self._check_rate_limit():
+            return {"error": "Rate limit exceeded"}, 429
+        return None
+
     def _send_json(self, data: dict, status: int = 200):
         try:
             self.send_response(status)
@@ -285,29 +334,38 @@ class AgentHandler(BaseHTTPRequestHandler):
         except BrokenPipeError:
             pass
 
+    def _status_payload(self) -> dict:
+        ctx = self.agent.get_context_usage()
+        return {
+            "name": self.agent.name, "model": self.agent.model,
+            "role": self.agent.role, "status": "active",
+            "protocol": "acp+a2a",
+            "context_length": ctx["context_length"],
+            "total_tokens_used": ctx["total_tokens_used"],
+            "context_usage_pct": ctx["context_usage_pct"],
+            "messages": ctx["messages"],
+            "capabilities": ctx["capabilities"],
+            "sessions_active": len([s for s in self.agent.sessions.values() if s.status == "active"])
+        }
+
     def do_GET(self):
         path = urlparse(self.path).path
-        # /status est public (health check), le reste nécessite auth
+        # /status et /snapshot sont publics (health check), le reste nécessite auth
+        if path == '/snapshot':
+            # Status + télémétrie en un aller-retour (télémétrie seulement si
+            # authentifié et sous la limite de débit, comme /telemetry)
+            telemetry = None
+            if self._deny_reason() is None:
+                telemetry = telemetry_registry.get_or_create(self.agent.name).get_stats()
+            self._send_json({"status": self._status_payload(), "telemetry": telemetry})
+            return
         if path != '/status':
-            if not self._check_auth():
-                self._send_json({"error": "Unauthorized"}, 401)
-                return
-            if not self._check_rate_limit():
-                self._send_json({"error": "Rate limit exceeded"}, 429)
+            denied = self._deny_reason()
+            if denied:
+                self._send_json(*denied)
                 return
         if path == '/status':
-            ctx = self.agent.get_context_usage()
-            self._send_json({
-                "name": self.agent.name, "model": self.agent.model,
-                "role": self.agent.role, "status": "active",
-                "protocol": "acp+a2a",
-                "context_length": ctx["context_length"],
-                "total_tokens_used": ctx["total_tokens_used"],
-                "context_usage_pct": ctx["context_usage_pct"],
-                "messages": ctx["messages"],
-                "capabilities": ctx["capabilities"],
-                "sessions_active": len([s for s in self.agent.sessions.values() if s.status == "active"])
-            })
+            self._send_json(self._status_payload())
         elif path == '/agents':
             self._send_json({"agents": {n: {"port": c["port"], "model": c["model"]} for n, c in AGENTS.items()}})
         elif path == '/.well-known/agent.json':
@@ -328,9 +386,7 @@ class AgentHandler(BaseHTTPRequestHandler):
         elif path.startswith('/sessions/') and path.count('/') == 2:
             # GET /sessions/{id}
             session_id = path.split('/')[2]
-            try:
-                uuid.UUID(session_id)
-            except (ValueError, AttributeError):
+            if not self._validate_uuid(session_id):
                 self._send_json({"error": "Invalid session ID"}, 400)
                 return
             session = self.agent.get_session(session_id)
@@ -369,21 +425,45 @@ class AgentHandler(BaseHTTPRequestHandler):
             self._send_json({"error": "Not found"}, 404)
 
     def _validate_uuid(self, value: str) -> bool:
-        """Valider qu'une valeur est un UUID valide"""
+        """Valider qu'une valeur est un UUID valide (forme canonique, 36 caractères)"""
+        # Rejet immédiat des longueurs impossibles, sans passer par uuid.UUID
+        if not isinstance(value, str) or len(value) != 36:
+            return False
         try:
             uuid.UUID(value)
             return True
         except (ValueError, AttributeError):
             return False
 
+    def _upload_multipart(self, content_type: str, raw: bytes):
+        """POST /files/upload en multipart : fichier brut (champ file) + metadata JSON."""
+        try:
+            fields, files = parse_multipart(content_type, raw)
+            meta = json.loads(fields.get('metadata') or '{}')
+        except (ValueError, TypeError):
+            self._send_json({"error": "Invalid multipart body"}, 400)
+            return
+        if not isinstance(meta, dict):
+            self._send_json({"error": "metadata doit être un objet"}, 400)
+            return
+        filename, content = files.get('file', ('', b''))
+        if not filename or not content:
+            self._send_json({"error": "filename et content requis"}, 400)
+            return
+        result = run_async(
+            ACPAgent._file_ingestion.upload_bytes(filename, content, metadata=meta)
+        )
+        if "error" in result:
+            self._send_json(result, 400)
+        else:
+            self._send_json(result)
+
     def do_POST(self):
         path = urlparse(self.path).path
         # Auth + rate limit sur toutes les requêtes POST
-        if not self._check_auth():
-            self._send_json({"error": "Unauthorized"}, 401)
-            return
-        if not self._check_rate_limit():
-            self._send_json({"error": "Rate limit exceeded"}, 429)
+        denied = self._deny_reason()
+        if denied:
+            self._send_json(*denied)
             return
         try:
             content_length = int(self.headers.get('Content-Length', 0))
@@ -399,7 +479,14 @@ class AgentHandler(BaseHTTPRequestHandler):
             self._send_json({"error": "Payload too large"}, 413)
             return
 
-        body = self.rfile.read(content_length).decode()
+        raw = self.rfile.read(content_length)
+
+        content_type = self.headers.get('Content-Type', '')
+        if path == '/files/upload' and content_type.startswith('multipart/form-data'):
+            self._upload_multipart(content_type, raw)
+            return
+
+        body = raw.decode()
 
         try:
             data = json.loads(body) if body else {}
@@ -647,11 +734,18 @@ def run_agent(agent_name: str):
     print_header(agent_name, config)
     print(f"{DIM}  🔒 Auth token: {AUTH_TOKEN[:8]}... (voir .acp_token){RST}\n", flush=True)
 
+    # start_all.py arrête les agents par SIGTERM : sortie normale pour que les
+    # handlers atexit (écritures différées du vector store) s'exécutent
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         print(f"\n{config['color']}[{agent_name}] Arrêté{RST}")
         server.shutdown()
+    finally:
+        # Fermer le pool keep-alive vers Ollama (comme CLIENT.aclose() côté MCP)
+        run_async(ACPAgent._vector_store.aclose(), timeout=5)
 
 
 if __name__ == "__main__":
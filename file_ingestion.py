@@ -14,7 +14,7 @@ import re
 import time
 import zipfile
 from io import BytesIO
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
 logger = logging.getLogger("file-ingestion")
 
@@ -24,11 +24,22 @@ UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
 BLOB_DIR = os.path.join(UPLOAD_DIR, "blobs")
 TEXT_DIR = os.path.join(UPLOAD_DIR, "texts")
 MANIFEST_PATH = os.path.join(UPLOAD_DIR, "manifest.json")
-ALLOWED_EXTENSIONS = {".pdf", ".docx", ".txt", ".md"}
+ALLOWED_EXTENSIONS = frozenset({".pdf", ".docx", ".txt", ".md"})
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 100
 MAX_FILES = 500
 
+# Colonnes du manifeste (stockage colonnes : une liste par champ)
+MANIFEST_KEYS = ("id", "filename", "extension", "size_bytes", "text_length",
+                 "chunks_indexed", "uploaded_at", "metadata")
+LIST_KEYS = ("id", "filename", "size_bytes", "text_length", "chunks_indexed", "uploaded_at")
+
+# Path traversal : '..', '/' ou '\\' détectés en un seul passage
+_UNSAFE_NAME_RE = re.compile(r'\.\.|[/\\]')
+# Chemins réels des répertoires, résolus une seule fois
+_REAL_BLOB_DIR = os.path.realpath(BLOB_DIR)
+_REAL_TEXT_DIR = os.path.realpath(TEXT_DIR)
+
 
 def ensure_dirs():
     """Créer les répertoires nécessaires."""
@@ -36,15 +47,34 @@ def ensure_dirs():
     os.makedirs(TEXT_DIR, exist_ok=True)
 
 
+def empty_manifest() -> Dict:
+    """Manifeste vide au format colonnes."""
+    return {"files": {k: [] for k in MANIFEST_KEYS}}
+
+
 def load_manifest() -> Dict:
-    """Charger le manifeste des fichiers uploadés."""
-    if os.path.exists(MANIFEST_PATH):
-        try:
-            with open(MANIFEST_PATH, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return {"files": []}
-    return {"files": []}
+    """Charger le manifeste des fichiers uploadés.
+
+    L'ancien format (liste de dicts, un par fichier) est converti en colonnes.
+    """
+    if not os.path.exists(MANIFEST_PATH):
+        return empty_manifest()
+    try:
+        with open(MANIFEST_PATH, 'r') as f:
+            manifest = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return empty_manifest()
+
+    files = manifest.get("files")
+    if isinstance(files, list):
+        manifest["files"] = {k: [entry.get(k) for entry in files] for k in MANIFEST_KEYS}
+    elif not isinstance(files, dict):
+        return empty_manifest()
+    else:
+        count = len(files.get("id", []))
+        for k in MANIFEST_KEYS:
+            files.setdefault(k, [None] * count)
+    return manifest
 
 
 def save_manifest(manifest: Dict):
@@ -59,11 +89,11 @@ def validate_filename(filename: str) -> Tuple[bool, str]:
     """Valider un nom de fichier (sécurité)."""
     if not filename or len(filename) > 255:
         return False, "Nom de fichier invalide"
-    if '..' in filename or '/' in filename or '\\' in filename:
+    if _UNSAFE_NAME_RE.search(filename):
         return False, "Path traversal bloqué"
     _, ext = os.path.splitext(filename.lower())
     if ext not in ALLOWED_EXTENSIONS:
-        return False, f"Extension non supportée: {ext}. Autorisées: {ALLOWED_EXTENSIONS}"
+        return False, f"Extension non supportée: {ext}. Autorisées: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
     return True, ""
 
 
@@ -132,17 +162,16 @@ def extract_text(data: bytes, extension: str) -> str:
     return ""
 
 
-def chunk_text_for_indexing(text: str) -> List[str]:
-    """Découper le texte en chunks pour indexation vectorielle."""
-    if not text:
-        return []
-    chunks = []
+def chunk_text_for_indexing(text: str) -> Iterator[str]:
+    """Découper le texte en chunks pour indexation vectorielle.
+
+    Générateur : un seul chunk matérialisé à la fois.
+    """
     step = max(CHUNK_SIZE - CHUNK_OVERLAP, 1)
     for i in range(0, len(text), step):
         chunk = text[i:i + CHUNK_SIZE]
         if chunk.strip():
-            chunks.append(chunk)
-    return chunks
+            yield chunk
 
 
 class FileIngestion:
@@ -156,18 +185,22 @@ class FileIngestion:
     async def upload(self, filename: str, content_b64: str,
                      metadata: Optional[Dict] = None) -> Dict:
         """Uploader un fichier (base64) → extraire → chunker → indexer."""
+        try:
+            data = base64.b64decode(content_b64)
+        except Exception:
+            return {"error": "Contenu base64 invalide"}
+        return await self.upload_bytes(filename, data, metadata)
+
+    async def upload_bytes(self, filename: str, data: bytes,
+                           metadata: Optional[Dict] = None) -> Dict:
+        """Uploader un fichier (bytes bruts, ex. multipart) → extraire → chunker → indexer."""
         valid, err = validate_filename(filename)
         if not valid:
             return {"error": err}
 
-        if len(self.manifest.get("files", [])) >= MAX_FILES:
+        if len(self.manifest["files"]["id"]) >= MAX_FILES:
             return {"error": f"Limite de {MAX_FILES} fichiers atteinte"}
 
-        try:
-            data = base64.b64decode(content_b64)
-        except Exception:
-            return {"error": "Contenu base64 invalide"}
-
         if len(data) > MAX_FILE_SIZE:
             return {"error": f"Fichier trop gros: {len(data)} bytes (max {MAX_FILE_SIZE})"}
 
@@ -176,7 +209,7 @@ class FileIngestion:
 
         # Sauvegarder le blob
         blob_path = os.path.join(BLOB_DIR, f"{file_id}{ext}")
-        if not os.path.realpath(blob_path).startswith(os.path.realpath(BLOB_DIR)):
+        if not os.path.realpath(blob_path).startswith(_REAL_BLOB_DIR):
             return {"error": "Path traversal bloqué"}
         with open(blob_path, 'wb') as f:
             f.write(data)
@@ -187,35 +220,27 @@ class FileIngestion:
         with open(text_path, 'w') as f:
             f.write(text)
 
-        # Indexer dans le vector store
+        # Indexer dans le vector store (embeddings par lots, une sauvegarde)
         chunks_indexed = 0
         if self.vector_store and text:
-            chunks = chunk_text_for_indexing(text)
-            for i, chunk in enumerate(chunks):
-                await self.vector_store.index(
-                    chunk,
-                    metadata={
-                        "source": "file",
-                        "file_id": file_id,
-                        "filename": filename,
-                        "chunk_index": i,
-                        **(metadata or {})
-                    }
-                )
-                chunks_indexed += 1
-
-        # Mettre à jour le manifeste
-        entry = {
-            "id": file_id,
-            "filename": filename,
-            "extension": ext,
-            "size_bytes": len(data),
-            "text_length": len(text),
-            "chunks_indexed": chunks_indexed,
-            "uploaded_at": time.time(),
-            "metadata": metadata or {}
-        }
-        self.manifest.setdefault("files", []).append(entry)
+            ids = await self.vector_store.index_many(
+                (chunk, {
+                    "source": "file",
+                    "file_id": file_id,
+                    "filename": filename,
+                    "chunk_index": i,
+                    **(metadata or {})
+                })
+                for i, chunk in enumerate(chunk_text_for_indexing(text))
+            )
+            chunks_indexed = len(ids)
+
+        # Mettre à jour le manifeste (une valeur par colonne, ordre MANIFEST_KEYS)
+        row = (file_id, filename, ext, len(data), len(text),
+               chunks_indexed, time.time(), metadata or {})
+        files = self.manifest["files"]
+        for k, value in zip(MANIFEST_KEYS, row):
+            files[k].append(value)
         save_manifest(self.manifest)
 
         return {
@@ -229,28 +254,22 @@ class FileIngestion:
 
     def list_files(self) -> List[Dict]:
         """Lister tous les fichiers uploadés."""
-        return [
-            {
-                "id": f["id"],
-                "filename": f["filename"],
-                "size_bytes": f["size_bytes"],
-                "text_length": f["text_length"],
-                "chunks_indexed": f["chunks_indexed"],
-                "uploaded_at": f["uploaded_at"]
-            }
-            for f in self.manifest.get("files", [])
-        ]
+        files = self.manifest["files"]
+        columns = [files[k] for k in LIST_KEYS]
+        return [dict(zip(LIST_KEYS, row)) for row in zip(*columns)]
 
     def get_file(self, file_id: str) -> Optional[Dict]:
         """Récupérer les détails d'un fichier."""
-        for f in self.manifest.get("files", []):
-            if f["id"] == file_id:
-                text_path = os.path.join(TEXT_DIR, f"{file_id}.txt")
-                text = ""
-                if os.path.exists(text_path):
-                    safe_path = os.path.realpath(text_path)
-                    if safe_path.startswith(os.path.realpath(TEXT_DIR)):
-                        with open(text_path, 'r') as fh:
-                            text = fh.read()
-                return {**f, "text": text[:5000]}
-        return None
+        files = self.manifest["files"]
+        try:
+            i = files["id"].index(file_id)
+        except ValueError:
+            return None
+        text_path = os.path.join(TEXT_DIR, f"{file_id}.txt")
+        text = ""
+        if os.path.exists(text_path):
+            safe_path = os.path.realpath(text_path)
+            if safe_path.startswith(_REAL_TEXT_DIR):
+                with open(text_path, 'r') as fh:
+                    text = fh.read()
+        return {**{k: files[k][i] for k in MANIFEST_KEYS}, "text": text[:5000]}
@@ -5,8 +5,13 @@ Chunking hiérarchique avec tailles Fibonacci, embeddings multi-granularité.
 Beam search pour recherche contextuelle optimisée.
 """
 
+import hashlib
+import heapq
 import math
+import os
+import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Tuple
 
 logger = logging.getLogger("fractal-memory")
@@ -17,42 +22,67 @@ FIBONACCI_OVERLAPS = [89, 61, 37, 23, 14]
 NUM_LEVELS = 5
 BEAM_WIDTH = 3
 TOP_K = 5
+PARALLEL_MIN_CHUNKS = 8  # En dessous, construction séquentielle (overhead threads)
+
+# La construction des sous-arbres tient le GIL : en parallèle seulement sur un
+# CPython free-threaded, sinon les threads ne font qu'ajouter leur surcoût
+PARALLEL_BUILD = not getattr(sys, "_is_gil_enabled", lambda: True)()
+_BUILD_POOL: Optional[ThreadPoolExecutor] = None  # créé au premier arbre construit en parallèle
+
+
+def _build_pool() -> ThreadPoolExecutor:
+    global _BUILD_POOL
+    if _BUILD_POOL is None:
+        _BUILD_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 4,
+                                         thread_name_prefix="fractal-build")
+    return _BUILD_POOL
 
 
 class FractalNode:
-    """Noeud dans l'arbre fractal Fibonacci."""
+    """Noeud dans l'arbre fractal Fibonacci.
 
-    def __init__(self, level: int, text: str, start: int, end: int):
+    Le noeud ne copie pas son texte : il garde une référence vers le texte
+    source et ses bornes, le slice n'est matérialisé qu'à la lecture de `text`.
+    """
+
+    def __init__(self, level: int, source: str, start: int, end: int):
         self.level = level
-        self.text = text
+        self.source = source
         self.start = start
         self.end = end
         self.embedding: Optional[List[float]] = None
         self.centroid: Optional[List[float]] = None
         self.children: List['FractalNode'] = []
 
+    @property
+    def text(self) -> str:
+        return self.source[self.start:self.end]
+
     def to_dict(self) -> Dict:
         return {
             "level": self.level,
             "start": self.start,
             "end": self.end,
-            "text_length": len(self.text),
+            "text_length": self.end - self.start,
             "has_embedding": self.embedding is not None,
             "has_centroid": self.centroid is not None,
             "children_count": len(self.children)
         }
 
 
-def chunk_text(text: str, chunk_size: int, overlap: int) -> List[Tuple[int, int, str]]:
-    """Découper un texte en chunks avec overlap. Retourne [(start, end, chunk_text)]."""
-    if not text:
+def chunk_text(length: int, chunk_size: int, overlap: int) -> List[Tuple[int, int]]:
+    """Découper un intervalle [0, length) en chunks avec overlap.
+
+    Retourne [(start, end)] — aucune copie de texte, l'appelant indexe la source.
+    """
+    if length <= 0:
         return []
     chunks = []
     step = max(chunk_size - overlap, 1)
-    for i in range(0, len(text), step):
-        end = min(i + chunk_size, len(text))
-        chunks.append((i, end, text[i:end]))
-        if end >= len(text):
+    for i in range(0, length, step):
+        end = min(i + chunk_size, length)
+        chunks.append((i, end))
+        if end >= length:
             break
     return chunks
 
@@ -71,32 +101,38 @@ def build_fractal_tree(text: str) -> Optional[FractalNode]:
 
     if len(text) < FIBONACCI_SIZES[-1]:
         # Texte trop court : un seul noeud feuille
-        return FractalNode(level=0, text=text, start=0, end=len(text))
+        return FractalNode(level=0, source=text, start=0, end=len(text))
 
-    root = FractalNode(level=-1, text="", start=0, end=len(text))
+    root = FractalNode(level=-1, source=text, start=0, end=len(text))
 
-    def build_level(parent_text: str, parent_start: int, level: int) -> List[FractalNode]:
+    def build_level(parent_start: int, parent_end: int, level: int) -> List[FractalNode]:
         if level >= NUM_LEVELS:
             return []
 
         chunk_size = FIBONACCI_SIZES[level]
         overlap = FIBONACCI_OVERLAPS[level]
 
-        chunks = chunk_text(parent_text, chunk_size, overlap)
-        nodes = []
-        for (start, end, chunk) in chunks:
-            node = FractalNode(
-                level=level,
-                text=chunk,
-                start=parent_start + start,
-                end=parent_start + end
-            )
-            if level < NUM_LEVELS - 1:
-                node.children = build_level(chunk, parent_start + start, level + 1)
-            nodes.append(node)
+        chunks = chunk_text(parent_end - parent_start, chunk_size, overlap)
+        nodes = [
+            FractalNode(level=level, source=text,
+                        start=parent_start + start, end=parent_start + end)
+            for (start, end) in chunks
+        ]
+        if level >= NUM_LEVELS - 1:
+            return nodes
+
+        if PARALLEL_BUILD and level == 0 and len(nodes) >= PARALLEL_MIN_CHUNKS:
+            # Sous-arbres L0 indépendants : construits en parallèle (sans GIL)
+            pool = _build_pool()
+            futures = [pool.submit(build_level, n.start, n.end, 1) for n in nodes]
+            for node, future in zip(nodes, futures):
+                node.children = future.result()
+        else:
+            for node in nodes:
+                node.children = build_level(node.start, node.end, level + 1)
         return nodes
 
-    root.children = build_level(text, 0, 0)
+    root.children = build_level(0, len(text), 0)
     return root
 
 
@@ -125,25 +161,32 @@ def compute_centroid(embeddings: List[List[float]]) -> Optional[List[float]]:
 
 async def embed_tree(root: FractalNode, vector_store) -> int:
     """Embedder les feuilles et calculer les centroids bottom-up.
+    Les feuilles au texte identique (sha1) partagent un seul embedding.
     Retourne le nombre d'embeddings générés."""
-    count = 0
+    # Regrouper les feuilles par contenu : chaque texte unique n'est embeddé qu'une fois
+    unique: Dict[bytes, List[FractalNode]] = {}
+    for child in root.children:
+        for leaf in get_leaves(child):
+            if leaf.end - leaf.start >= 10:
+                digest = hashlib.sha1(leaf.text.encode()).digest()
+                unique.setdefault(digest, []).append(leaf)
 
-    async def embed_node(node: FractalNode):
-        nonlocal count
+    count = 0
+    for leaves in unique.values():
+        emb = await vector_store.get_embedding(leaves[0].text)
+        if emb:
+            count += 1
+        for leaf in leaves:
+            leaf.embedding = emb
+
+    def compute_centroids(node: FractalNode):
         if not node.children:
-            # Feuille : générer embedding
-            if node.text and len(node.text) >= 10:
-                emb = await vector_store.get_embedding(node.text)
-                node.embedding = emb
-                if emb:
-                    count += 1
             return
 
-        # Noeud interne : embedder les enfants d'abord
+        # Noeud interne : centroids des enfants d'abord
         for child in node.children:
-            await embed_node(child)
+            compute_centroids(child)
 
-        # Calculer le centroid
         child_embs = []
         for child in node.children:
             if child.embedding:
@@ -153,7 +196,7 @@ async def embed_tree(root: FractalNode, vector_store) -> int:
         node.centroid = compute_centroid(child_embs)
 
     for child in root.children:
-        await embed_node(child)
+        compute_centroids(child)
 
     return count
 
@@ -187,8 +230,7 @@ def beam_search(root: FractalNode, query_embedding: List[float],
                 score = 0.0
             scored.append((score, node))
 
-        scored.sort(key=lambda x: x[0], reverse=True)
-        top_nodes = scored[:beam_width]
+        top_nodes = heapq.nlargest(beam_width, scored, key=lambda x: x[0])
 
         # Collecter les résultats (feuilles ou noeuds terminaux)
         next_beam = []
@@ -210,7 +252,7 @@ def beam_search(root: FractalNode, query_embedding: List[float],
             for score, node in top_nodes:
                 if node.children:
                     all_scored.append({
-                        "text": node.text[:500],
+                        "text": node.source[node.start:min(node.end, node.start + 500)],
                         "score": round(score, 4),
                         "level": node.level,
                         "start": node.start,
@@ -220,8 +262,7 @@ def beam_search(root: FractalNode, query_embedding: List[float],
 
         current_beam = next_beam
 
-    all_scored.sort(key=lambda x: x["score"], reverse=True)
-    return all_scored[:top_k]
+    return heapq.nlargest(top_k, all_scored, key=lambda x: x["score"])
 
 
 class FractalMemory:
@@ -7,15 +7,36 @@ Supporte la découverte d'agents et les sessions
 
 import sys
 import json
+import base64
 import os
-import re
+import time
+import asyncio
 import logging
-import requests
+import threading
+from typing import Optional
+import httpx
+
+try:
+    import orjson
+except ImportError:  # orjson optionnel : (dé)sérialisation JSON plus rapide
+    orjson = None
+
+if orjson:
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+else:
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s [mcp] %(message)s')
 logger = logging.getLogger("mcp")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("httpcore").setLevel(logging.WARNING)
 
-UUID_RE = re.compile(r'^[a-f0-9-]{36}$')
+# Caractères autorisés dans un session_id (équivalent de ^[a-f0-9-]{36}$)
+SESSION_ID_CHARS = b"0123456789abcdef-"
 
 AGENT_CARDS_DIR = os.path.join(os.path.dirname(__file__), "agent_cards")
 
@@ -32,50 +53,241 @@ AGENTS = {
     "legal": {"port": 8010, "model": "gpt-oss:120b-cloud", "role": "Légal/RGPD"}
 }
 
-def call_agent(agent: str, message: str) -> str:
+# AGENTS est figé à l'exécution : la réponse list_agents est calculée une fois
+_LIST_AGENTS_TEXT = "Agents ACP (10):\n" + "\n".join(
+    f"- {n}: {c['role']} ({c['model']}) → port {c['port']}" for n, c in AGENTS.items()
+)
+_LIST_AGENTS_RESP = {"content": [{"type": "text", "text": _LIST_AGENTS_TEXT}]}
+
+def _agent_urls(path: str) -> dict:
+    """URL complète d'un endpoint pour chaque agent."""
+    return {n: f"http://localhost:{c['port']}{path}" for n, c in AGENTS.items()}
+
+# URLs précalculées à l'import (pas de f-string par requête)
+_URL_MESSAGE = _agent_urls("/message")
+_URL_STATUS = _agent_urls("/status")
+_URL_SNAPSHOT = _agent_urls("/snapshot")
+_URL_SESSIONS = _agent_urls("/sessions")
+_URL_SESSION_MSG_TMPL = _agent_urls("/sessions/{sid}/messages")
+_URL_ARCHIVE_SEARCH = _agent_urls("/archive/search")
+_URL_ARCHIVE_INDEX = _agent_urls("/archive/index")
+_URL_FILES_UPLOAD = _agent_urls("/files/upload")
+_URL_FILES = _agent_urls("/files")
+_URL_TELEMETRY = _agent_urls("/telemetry")
+_URL_GRAPH = _agent_urls("/graph")
+
+# Corps JSON pré-sérialisés par _dumps (orjson si disponible) et envoyés en bytes
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Client HTTP async partagé : connexions keep-alive réutilisées entre les appels
+# (pool dimensionné pour les fan-out sur les 10 agents + appels concurrents)
+HTTP_POOL_SIZE = 32
+CLIENT = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=HTTP_POOL_SIZE,
+                        max_keepalive_connections=HTTP_POOL_SIZE,
+                        keepalive_expiry=60)
+)
+
+async def call_agent(agent: str, message: str) -> str:
     if agent not in AGENTS:
         return f"Agent '{agent}' inconnu"
     try:
-        r = requests.post(f"http://localhost:{AGENTS[agent]['port']}/message",
-                         json={"message": message, "from": "claude"}, timeout=120)
-        return r.json().get("response", "Erreur de l'agent")
+        r = await CLIENT.post(_URL_MESSAGE[agent],
+                              content=_dumps({"message": message, "from": "claude"}),
+                              headers=_JSON_HEADERS, timeout=120)
+        return _loads(r.content).get("response", "Erreur de l'agent")
     except Exception as e:
         logger.error(f"Erreur appel {agent}: {e}")
         return "Erreur de communication avec l'agent"
 
 
-def discover_agents() -> dict:
+def is_valid_session_id(session_id) -> bool:
+    """36 caractères parmi [0-9a-f-] — bytes.translate au lieu du moteur regex."""
+    if not isinstance(session_id, str) or len(session_id) != 36:
+        return False
+    raw = session_id.encode("ascii", "ignore")
+    return len(raw) == 36 and not raw.translate(None, SESSION_ID_CHARS)
+
+
+# Cache des Agent Cards : chemin -> ((st_mtime_ns, st_size), carte parsée)
+_CARD_CACHE: dict = {}
+# Cache des listings : dossier -> (st_mtime_ns du dossier, chemins .json triés)
+_DIR_CACHE: dict = {}
+
+def load_card(path: str, st: Optional[os.stat_result] = None) -> dict:
+    """Charger une Agent Card, re-parsée uniquement si le fichier a changé.
+
+    `st` peut être fourni par l'appelant (DirEntry.stat() lors du listing).
+    """
+    cached = _CARD_CACHE.get(path)
+    if st is None:
+        try:
+            st = os.stat(path)
+        except OSError:
+            if cached:
+                return cached[1]  # stale-while-revalidate : on sert la dernière version connue
+            raise
+    key = (st.st_mtime_ns, st.st_size)
+    if cached and cached[0] == key:
+        return cached[1]
+    with open(path, 'rb') as fh:
+        card = _loads(fh.read())
+    _CARD_CACHE[path] = (key, card)
+    return card
+
+
+def list_cards(card_dir: str) -> list:
+    """(chemin, stat ou None) des Agent Cards d'un dossier, re-listé seulement si le
+    dossier a changé. Au re-listing, os.scandir fournit le stat de chaque fichier ;
+    depuis le cache, None : load_card vérifie lui-même si le fichier a changé."""
+    mtime = os.stat(card_dir).st_mtime_ns
+    cached = _DIR_CACHE.get(card_dir)
+    if cached and cached[0] == mtime:
+        return [(path, None) for path in cached[1]]
+    with os.scandir(card_dir) as it:
+        entries = sorted((e for e in it if e.name.endswith(".json")), key=lambda e: e.name)
+    cards = []
+    for entry in entries:
+        try:
+            st = entry.stat()
+        except OSError:
+            st = None
+        cards.append((entry.path, st))
+    _DIR_CACHE[card_dir] = (mtime, [path for path, _ in cards])
+    return cards
+
+
+# Disjoncteur par agent : après un échec, l'agent est marqué offline sans
+# appel réseau jusqu'à l'échéance stockée (time.monotonic()), remis à zéro au succès
+BREAKER_COOLDOWN = 15  # secondes
+_BREAKER: dict = {}
+
+def breaker_open(name: str) -> bool:
+    return _BREAKER.get(name, 0) > time.monotonic()
+
+def breaker_trip(name: str):
+    _BREAKER[name] = time.monotonic() + BREAKER_COOLDOWN
+
+
+# Token inter-agents (écrit par agent_runner) : /snapshot ne renvoie la télémétrie
+# qu'aux appelants authentifiés, comme /telemetry
+_TOKEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".acp_token")
+# (st_mtime_ns du fichier token, headers) — relu seulement si le fichier a changé
+_INTERNAL_HEADERS: list = [None, {}]
+
+def _internal_headers() -> dict:
+    """Header X-ACP-Internal, comme pour les requêtes entre agents ({} sans token)."""
+    try:
+        mtime = os.stat(_TOKEN_PATH).st_mtime_ns
+    except OSError:
+        return {}
+    if _INTERNAL_HEADERS[0] != mtime:
+        try:
+            with open(_TOKEN_PATH, 'r') as f:
+                token = f.read().strip()
+        except OSError:
+            return {}
+        _INTERNAL_HEADERS[:] = [mtime, {"X-ACP-Internal": token} if token else {}]
+    return _INTERNAL_HEADERS[1]
+
+# Probes : échec rapide sur un port mort (localhost)
+PROBE_TIMEOUT = httpx.Timeout(1.0, connect=0.2)
+# Agents sans /snapshot (ancienne version) : probe via /status seul
+_NO_SNAPSHOT: set = set()
+# Télémétrie reçue avec le dernier /snapshot : nom -> (time.monotonic(), stats)
+_SNAPSHOT_TELEMETRY: dict = {}
+
+async def _fetch_status(name: str) -> Optional[dict]:
+    """Status d'un agent via /snapshot (télémétrie mise en cache au passage) ou /status."""
+    if name not in _NO_SNAPSHOT:
+        r = await CLIENT.get(_URL_SNAPSHOT[name], headers=_internal_headers(),
+                             timeout=PROBE_TIMEOUT)
+        if r.status_code == 200:
+            snap = _loads(r.content)
+            if snap.get("telemetry"):
+                _SNAPSHOT_TELEMETRY[name] = (time.monotonic(), snap["telemetry"])
+            return snap.get("status")
+        if r.status_code != 404:
+            return None
+        _NO_SNAPSHOT.add(name)
+    r = await CLIENT.get(_URL_STATUS[name], timeout=PROBE_TIMEOUT)
+    return _loads(r.content) if r.status_code == 200 else None
+
+
+async def _probe_agent(name: str, cfg: dict, force: bool = False) -> Optional[dict]:
+    """Sonder un agent. None si l'agent répond sans statut 200."""
+    if not force and breaker_open(name):
+        return {"name": name, "status": "offline"}
+    try:
+        data = await _fetch_status(name)
+    except Exception:
+        breaker_trip(name)
+        return {"name": name, "status": "offline"}
+    _BREAKER.pop(name, None)
+    if data is None:
+        return None
+    return {
+        "name": name,
+        "status": "online",
+        "model": data.get("model", cfg["model"]),
+        "context_usage_pct": data.get("context_usage_pct", 0),
+        "messages": data.get("messages", 0),
+        "protocol": data.get("protocol", "acp")
+    }
+
+
+async def _discover_uncached(force: bool = False) -> dict:
     """Découvrir tous les agents via Agent Cards (ACP/A2A)"""
     result = {"ollama": [], "anthropic": [], "live": []}
 
     # Charger les Agent Cards depuis les fichiers
     for system in ("ollama", "anthropic"):
-        card_dir = os.path.join(AGENT_CARDS_DIR, system)
-        if os.path.isdir(card_dir):
-            for f in sorted(os.listdir(card_dir)):
-                if f.endswith(".json"):
-                    with open(os.path.join(card_dir, f)) as fh:
-                        result[system].append(json.load(fh))
-
-    # Vérifier les agents Ollama en live
-    for name, cfg in AGENTS.items():
         try:
-            r = requests.get(f"http://localhost:{cfg['port']}/status", timeout=3)
-            if r.status_code == 200:
-                data = r.json()
-                result["live"].append({
-                    "name": name,
-                    "status": "online",
-                    "model": data.get("model", cfg["model"]),
-                    "context_usage_pct": data.get("context_usage_pct", 0),
-                    "messages": data.get("messages", 0),
-                    "protocol": data.get("protocol", "acp")
-                })
-        except Exception:
-            result["live"].append({"name": name, "status": "offline"})
+            cards = list_cards(os.path.join(AGENT_CARDS_DIR, system))
+        except OSError:
+            continue
+        for path, st in cards:
+            result[system].append(load_card(path, st))
+
+    # Vérifier les agents Ollama en live (probes concurrentes, ordre AGENTS conservé)
+    entries = await asyncio.gather(*(_probe_agent(n, c, force) for n, c in AGENTS.items()))
+    result["live"] = [e for e in entries if e is not None]
 
     return result
 
+
+# Cache court de la découverte : une rafale d'appels = un seul aller-retour réseau
+DISCOVERY_TTL = 2.5  # secondes
+_DISC_CACHE = {"ts": 0.0, "data": None}
+_DISC_LOCK = asyncio.Lock()
+
+def _discovery_fresh() -> bool:
+    return _DISC_CACHE["data"] is not None and time.monotonic() - _DISC_CACHE["ts"] < DISCOVERY_TTL
+
+async def discover_agents(force_refresh: bool = False) -> dict:
+    """Découvrir tous les agents (résultat partagé pendant DISCOVERY_TTL secondes).
+
+    `force_refresh` ignore le cache et le disjoncteur : tous les agents sont sondés.
+    """
+    if not force_refresh and _discovery_fresh():
+        return _DISC_CACHE["data"]
+    async with _DISC_LOCK:
+        # Un appel concurrent a peut-être déjà rafraîchi le cache
+        if not force_refresh and _discovery_fresh():
+            return _DISC_CACHE["data"]
+        try:
+            data = await _discover_uncached(force_refresh)
+        except Exception as e:
+            if _DISC_CACHE["data"] is None:
+                raise
+            # stale-while-revalidate : on sert le dernier résultat connu
+            logger.warning(f"Découverte échouée, résultat précédent servi: {e}")
+            return _DISC_CACHE["data"]
+        _DISC_CACHE["ts"] = time.monotonic()
+        _DISC_CACHE["data"] = data
+        return data
+
+
 def make_tool(name: str, description: str):
     return {
         "name": name,
@@ -87,7 +299,7 @@ def make_tool(name: str, description: str):
         }
     }
 
-def tools_list():
+def _build_tools_list():
     return {
         "tools": [
             make_tool("ask_orchestrator", "Agent coordinateur principal (glm-5, 744B) — orchestration et délégation"),
@@ -101,7 +313,7 @@ def tools_list():
             make_tool("ask_design", "Agent design/UX (kimi-k2.5, vision) — maquettes, ergonomie, accessibilité"),
             make_tool("ask_legal", "Agent légal (gpt-oss, 120B) — RGPD, conformité, mentions légales"),
             {"name": "list_agents", "description": "Lister tous les agents ACP avec leur statut", "inputSchema": {"type": "object", "properties": {}}},
-            {"name": "discover_agents", "description": "Découvrir tous les agents (ACP/A2A) — Agent Cards Ollama + Anthropic + statut live", "inputSchema": {"type": "object", "properties": {}}},
+            {"name": "discover_agents", "description": "Découvrir tous les agents (ACP/A2A) — Agent Cards Ollama + Anthropic + statut live", "inputSchema": {"type": "object", "properties": {"force_refresh": {"type": "boolean", "description": "Ignorer le cache et re-sonder les agents offline"}}}},
             {"name": "create_session", "description": "Créer une session ACP avec un agent pour une conversation avec état", "inputSchema": {
                 "type": "object",
                 "properties": {
@@ -164,206 +376,388 @@ def tools_list():
         ]
     }
 
-def handle(req):
-    method = req.get("method", "")
-    params = req.get("params", {})
-
-    if method == "initialize":
-        return {"protocolVersion": "2024-11-05", "capabilities": {"tools": {}}, "serverInfo": {"name": "acp-agents", "version": "2.0"}}
-    elif method == "tools/list":
-        return tools_list()
-    elif method == "tools/call":
-        name = params.get("name", "")
-        args = params.get("arguments", {})
-        if name == "list_agents":
-            txt = "\n".join([f"- {n}: {c['role']} ({c['model']}) → port {c['port']}" for n, c in AGENTS.items()])
-            return {"content": [{"type": "text", "text": f"Agents ACP (10):\n{txt}"}]}
-        elif name == "discover_agents":
-            data = discover_agents()
-            ollama_count = len(data["ollama"])
-            anthropic_count = len(data["anthropic"])
-            live_online = [a for a in data["live"] if a["status"] == "online"]
-            txt = f"🔍 Discovery ACP/A2A\n\n"
-            txt += f"Agent Cards Ollama: {ollama_count}\n"
-            for card in data["ollama"]:
-                txt += f"  - {card['name']}: {card.get('description', '')} ({card.get('model', {}).get('name', '')})\n"
-            txt += f"\nAgent Cards Anthropic: {anthropic_count}\n"
-            for card in data["anthropic"]:
-                txt += f"  - {card['name']}: {card.get('description', '')} ({card.get('model', {}).get('name', '')})\n"
-            txt += f"\nAgents live: {len(live_online)}/{len(data['live'])} en ligne\n"
-            for a in data["live"]:
-                if a["status"] == "online":
-                    txt += f"  ● {a['name']}: {a['model']} — ctx {a['context_usage_pct']}% — {a['messages']} msgs — {a['protocol']}\n"
-                else:
-                    txt += f"  ○ {a['name']}: offline\n"
-            return {"content": [{"type": "text", "text": txt}]}
-        elif name == "create_session":
-            agent_name = args.get("agent", "")
-            if agent_name not in AGENTS:
-                return {"content": [{"type": "text", "text": f"Agent '{agent_name}' inconnu"}]}
-            try:
-                r = requests.post(f"http://localhost:{AGENTS[agent_name]['port']}/sessions",
-                                 json={"metadata": args.get("metadata", {})}, timeout=10)
-                data = r.json()
-                return {"content": [{"type": "text", "text": f"Session créée: {data.get('session_id', '?')} sur {agent_name}"}]}
-            except Exception as e:
-                logger.error(f"Erreur création session: {e}")
-                return {"content": [{"type": "text", "text": "Erreur lors de la création de la session"}]}
-        elif name == "session_message":
-            agent_name = args.get("agent", "")
-            session_id = args.get("session_id", "")
-            message = args.get("message", "")
-            if agent_name not in AGENTS:
-                return {"content": [{"type": "text", "text": f"Agent '{agent_name}' inconnu"}]}
-            if not UUID_RE.match(session_id):
-                return {"content": [{"type": "text", "text": "ID de session invalide"}]}
-            try:
-                r = requests.post(f"http://localhost:{AGENTS[agent_name]['port']}/sessions/{session_id}/messages",
-                                 json={"message": message, "from": "claude"}, timeout=120)
-                data = r.json()
-                return {"content": [{"type": "text", "text": data.get("response", "Pas de réponse")}]}
-            except Exception as e:
-                logger.error(f"Erreur session message: {e}")
-                return {"content": [{"type": "text", "text": "Erreur de communication avec l'agent"}]}
-        # === Features AMBER ICI ===
-        elif name == "archive_search":
-            query = args.get("query", "")
-            top_k = args.get("top_k", 5)
-            agent_name = "code"
-            try:
-                r = requests.post(
-                    f"http://localhost:{AGENTS[agent_name]['port']}/archive/search",
-                    json={"query": query, "top_k": top_k}, timeout=30
-                )
-                data = r.json()
-                results = data.get("results", [])
-                txt = f"Archive Search: {len(results)} résultats\n\n"
-                for i, res in enumerate(results):
-                    txt += f"{i+1}. [score: {res['score']}] {res['text'][:200]}\n"
-                    if res.get("metadata"):
-                        txt += f"   meta: {json.dumps(res['metadata'])}\n"
-                return {"content": [{"type": "text", "text": txt}]}
-            except Exception as e:
-                return {"content": [{"type": "text", "text": f"Erreur archive search: {e}"}]}
-        elif name == "archive_index":
-            text = args.get("text", "")
-            agent_name = args.get("agent", "code")
-            meta = args.get("metadata", {})
-            if agent_name not in AGENTS:
-                agent_name = "code"
-            try:
-                r = requests.post(
-                    f"http://localhost:{AGENTS[agent_name]['port']}/archive/index",
-                    json={"text": text, "metadata": meta}, timeout=30
-                )
-                data = r.json()
-                return {"content": [{"type": "text", "text": f"Indexé: {data.get('id', '?')} — {data.get('status', '?')}"}]}
-            except Exception as e:
-                return {"content": [{"type": "text", "text": f"Erreur indexation: {e}"}]}
-        elif name == "upload_file":
-            agent_name = args.get("agent", "code")
-            filename = args.get("filename", "")
-            content = args.get("content", "")
-            meta = args.get("metadata", {})
-            if agent_name not in AGENTS:
-                agent_name = "code"
-            try:
-                r = requests.post(
-                    f"http://localhost:{AGENTS[agent_name]['port']}/files/upload",
-                    json={"filename": filename, "content": content, "metadata": meta},
-                    timeout=120
-                )
-                data = r.json()
-                if "error" in data:
-                    return {"content": [{"type": "text", "text": f"Erreur upload: {data['error']}"}]}
-                txt = f"Fichier uploadé: {data.get('filename', '?')}\n"
-                txt += f"ID: {data.get('id', '?')}\n"
-                txt += f"Taille: {data.get('size_bytes', 0)} bytes\n"
-                txt += f"Texte extrait: {data.get('text_extracted', 0)} chars\n"
-                txt += f"Chunks indexés: {data.get('chunks_indexed', 0)}"
-                return {"content": [{"type": "text", "text": txt}]}
-            except Exception as e:
-                return {"content": [{"type": "text", "text": f"Erreur upload: {e}"}]}
-        elif name == "list_files":
-            agent_name = args.get("agent", "code")
-            if agent_name not in AGENTS:
-                agent_name = "code"
-            try:
-                r = requests.get(
-                    f"http://localhost:{AGENTS[agent_name]['port']}/files", timeout=10
-                )
-                data = r.json()
-                files = data.get("files", [])
-                txt = f"Fichiers uploadés: {len(files)}\n\n"
-                for f in files:
-                    txt += f"  — {f['filename']} ({f['size_bytes']} bytes, {f['chunks_indexed']} chunks)\n"
-                return {"content": [{"type": "text", "text": txt}]}
-            except Exception as e:
-                return {"content": [{"type": "text", "text": f"Erreur list files: {e}"}]}
-        elif name == "get_telemetry":
-            txt = "Télémétrie ACP Agents\n\n"
-            for ag_name, cfg in AGENTS.items():
-                try:
-                    r = requests.get(
-                        f"http://localhost:{cfg['port']}/telemetry", timeout=3
-                    )
-                    data = r.json()
-                    tps = data.get("current_tps", 0)
-                    peak = data.get("peak_tps", 0)
-                    avg = data.get("avg_tps", 0)
-                    t_in = data.get("total_tokens_in", 0)
-                    t_out = data.get("total_tokens_out", 0)
-                    txt += f"  {ag_name}: {tps:.1f} tok/s (avg: {avg:.1f}, peak: {peak:.1f}) | in: {t_in} out: {t_out}\n"
-                except Exception:
-                    txt += f"  {ag_name}: offline\n"
-            return {"content": [{"type": "text", "text": txt}]}
-        elif name == "get_graph":
-            agent_name = "code"
-            try:
-                r = requests.get(
-                    f"http://localhost:{AGENTS[agent_name]['port']}/graph", timeout=10
-                )
-                data = r.json()
-                nodes = data.get("nodes", [])
-                edges = data.get("edges", [])
-                txt = f"Graph ACP: {len(nodes)} noeuds, {len(edges)} arêtes\n\n"
-                txt += "Noeuds:\n"
-                for n in nodes[:20]:
-                    txt += f"  [{n['type']}] {n['id']}: {n['label']}\n"
-                txt += "\nArêtes:\n"
-                for e in edges[:20]:
-                    txt += f"  {e['source']} —{e['type']}→ {e['target']}\n"
-                if len(nodes) > 20:
-                    txt += f"\n... et {len(nodes) - 20} noeuds de plus\n"
-                if len(edges) > 20:
-                    txt += f"... et {len(edges) - 20} arêtes de plus\n"
-                return {"content": [{"type": "text", "text": txt}]}
-            except Exception as e:
-                return {"content": [{"type": "text", "text": f"Erreur graph: {e}"}]}
-        elif name.startswith("ask_"):
-            agent = name.replace("ask_", "")
-            if agent in AGENTS:
-                resp = call_agent(agent, args.get("message", ""))
-                return {"content": [{"type": "text", "text": resp}]}
-            return {"content": [{"type": "text", "text": f"Agent '{agent}' inconnu"}]}
-        return {"error": f"Outil inconnu: {name}"}
-    return {"error": "Méthode non supportée"}
+# Catalogue constant : construit et sérialisé une seule fois à l'import
+_TOOLS_LIST = _build_tools_list()
+_TOOLS_LIST_JSON = _dumps(_TOOLS_LIST)
+_TOOLS_LIST_JSON_PREFIX = _TOOLS_LIST_JSON[:-1] + b',"id":'
 
-def main():
-    for line in sys.stdin:
+def tools_list():
+    return _TOOLS_LIST
+
+def tools_list_json(req_id=None) -> bytes:
+    """Réponse tools/list sérialisée, id ajouté sans re-sérialiser le catalogue."""
+    if req_id is None:
+        return _TOOLS_LIST_JSON
+    return _TOOLS_LIST_JSON_PREFIX + _dumps(req_id) + b"}"
+
+
+# Handlers tools/call : un par outil, dispatch via _TOOL_HANDLERS
+async def _tool_list_agents(args: dict) -> dict:
+    return _LIST_AGENTS_RESP
+
+
+async def _tool_discover_agents(args: dict) -> dict:
+    data = await discover_agents(bool(args.get("force_refresh", False)))
+    live_online = [a for a in data["live"] if a["status"] == "online"]
+    parts = ["🔍 Discovery ACP/A2A\n\n", f"Agent Cards Ollama: {len(data['ollama'])}\n"]
+    for card in data["ollama"]:
+        parts.append(f"  - {card['name']}: {card.get('description', '')} ({card.get('model', {}).get('name', '')})\n")
+    parts.append(f"\nAgent Cards Anthropic: {len(data['anthropic'])}\n")
+    for card in data["anthropic"]:
+        parts.append(f"  - {card['name']}: {card.get('description', '')} ({card.get('model', {}).get('name', '')})\n")
+    parts.append(f"\nAgents live: {len(live_online)}/{len(data['live'])} en ligne\n")
+    for a in data["live"]:
+        if a["status"] == "online":
+            parts.append(f"  ● {a['name']}: {a['model']} — ctx {a['context_usage_pct']}% — {a['messages']} msgs — {a['protocol']}\n")
+        else:
+            parts.append(f"  ○ {a['name']}: offline\n")
+    return {"content": [{"type": "text", "text": "".join(parts)}]}
+
+
+async def _tool_create_session(args: dict) -> dict:
+    agent_name = args.get("agent", "")
+    if agent_name not in AGENTS:
+        return {"content": [{"type": "text", "text": f"Agent '{agent_name}' inconnu"}]}
+    try:
+        r = await CLIENT.post(_URL_SESSIONS[agent_name],
+                              content=_dumps({"metadata": args.get("metadata", {})}),
+                              headers=_JSON_HEADERS, timeout=10)
+        data = _loads(r.content)
+        return {"content": [{"type": "text", "text": f"Session créée: {data.get('session_id', '?')} sur {agent_name}"}]}
+    except Exception as e:
+        logger.error(f"Erreur création session: {e}")
+        return {"content": [{"type": "text", "text": "Erreur lors de la création de la session"}]}
+
+
+async def _tool_session_message(args: dict) -> dict:
+    agent_name = args.get("agent", "")
+    session_id = args.get("session_id", "")
+    message = args.get("message", "")
+    if agent_name not in AGENTS:
+        return {"content": [{"type": "text", "text": f"Agent '{agent_name}' inconnu"}]}
+    if not is_valid_session_id(session_id):
+        return {"content": [{"type": "text", "text": "ID de session invalide"}]}
+    try:
+        r = await CLIENT.post(_URL_SESSION_MSG_TMPL[agent_name].format(sid=session_id),
+                              content=_dumps({"message": message, "from": "claude"}),
+                              headers=_JSON_HEADERS, timeout=120)
+        data = _loads(r.content)
+        return {"content": [{"type": "text", "text": data.get("response", "Pas de réponse")}]}
+    except Exception as e:
+        logger.error(f"Erreur session message: {e}")
+        return {"content": [{"type": "text", "text": "Erreur de communication avec l'agent"}]}
+
+
+# === Features AMBER ICI ===
+async def _tool_archive_search(args: dict) -> dict:
+    query = args.get("query", "")
+    top_k = args.get("top_k", 5)
+    agent_name = "code"
+    try:
+        r = await CLIENT.post(
+            _URL_ARCHIVE_SEARCH[agent_name],
+            content=_dumps({"query": query, "top_k": top_k}),
+            headers=_JSON_HEADERS, timeout=30
+        )
+        data = _loads(r.content)
+        results = data.get("results", [])
+        parts = [f"Archive Search: {len(results)} résultats\n\n"]
+        for i, res in enumerate(results):
+            parts.append(f"{i+1}. [score: {res['score']}] {res['text'][:200]}\n")
+            if res.get("metadata"):
+                parts.append(f"   meta: {_dumps(res['metadata']).decode()}\n")
+        return {"content": [{"type": "text", "text": "".join(parts)}]}
+    except Exception as e:
+        return {"content": [{"type": "text", "text": f"Erreur archive search: {e}"}]}
+
+
+async def _tool_archive_index(args: dict) -> dict:
+    text = args.get("text", "")
+    agent_name = args.get("agent", "code")
+    meta = args.get("metadata", {})
+    if agent_name not in AGENTS:
+        agent_name = "code"
+    try:
+        r = await CLIENT.post(
+            _URL_ARCHIVE_INDEX[agent_name],
+            content=_dumps({"text": text, "metadata": meta}),
+            headers=_JSON_HEADERS, timeout=30
+        )
+        data = _loads(r.content)
+        return {"content": [{"type": "text", "text": f"Indexé: {data.get('id', '?')} — {data.get('status', '?')}"}]}
+    except Exception as e:
+        return {"content": [{"type": "text", "text": f"Erreur indexation: {e}"}]}
+
+
+async def _tool_upload_file(args: dict) -> dict:
+    agent_name = args.get("agent", "code")
+    filename = args.get("filename", "")
+    content = args.get("content", "")
+    meta = args.get("metadata", {})
+    if agent_name not in AGENTS:
+        agent_name = "code"
+    # Le client MCP envoie du base64 ; l'agent reçoit les bytes bruts en multipart
+    try:
+        raw = base64.b64decode(content)
+    except Exception:
+        return {"content": [{"type": "text", "text": "Erreur upload: Contenu base64 invalide"}]}
+    try:
+        r = await CLIENT.post(
+            _URL_FILES_UPLOAD[agent_name],
+            files={"file": (filename, raw)},
+            data={"metadata": _dumps(meta).decode()},
+            timeout=120
+        )
+        data = _loads(r.content)
+        if "error" in data:
+            return {"content": [{"type": "text", "text": f"Erreur upload: {data['error']}"}]}
+        txt = (f"Fichier uploadé: {data.get('filename', '?')}\n"
+               f"ID: {data.get('id', '?')}\n"
+               f"Taille: {data.get('size_bytes', 0)} bytes\n"
+               f"Texte extrait: {data.get('text_extracted', 0)} chars\n"
+               f"Chunks indexés: {data.get('chunks_indexed', 0)}")
+        return {"content": [{"type": "text", "text": txt}]}
+    except Exception as e:
+        return {"content": [{"type": "text", "text": f"Erreur upload: {e}"}]}
+
+
+async def _tool_list_files(args: dict) -> dict:
+    agent_name = args.get("agent", "code")
+    if agent_name not in AGENTS:
+        agent_name = "code"
+    try:
+        r = await CLIENT.get(
+            _URL_FILES[agent_name], timeout=10
+        )
+        data = _loads(r.content)
+        files = data.get("files", [])
+        parts = [f"Fichiers uploadés: {len(files)}\n\n"]
+        for f in files:
+            parts.append(f"  — {f['filename']} ({f['size_bytes']} bytes, {f['chunks_indexed']} chunks)\n")
+        return {"content": [{"type": "text", "text": "".join(parts)}]}
+    except Exception as e:
+        return {"content": [{"type": "text", "text": f"Erreur list files: {e}"}]}
+
+
+async def _telemetry_line(ag_name: str) -> str:
+    """Ligne de télémétrie d'un agent (offline en cas d'échec)."""
+    if breaker_open(ag_name):
+        return f"  {ag_name}: offline\n"
+    cached = _SNAPSHOT_TELEMETRY.get(ag_name)
+    if cached and time.monotonic() - cached[0] < DISCOVERY_TTL:
+        data = cached[1]  # déjà reçue avec le /snapshot d'une découverte récente
+    else:
         try:
-            req = json.loads(line.strip())
-            resp = handle(req)
-            req_id = req.get("id")
-            if isinstance(req_id, (int, str)) and len(str(req_id)) < 256:
-                resp["id"] = req_id
-            print(json.dumps(resp), flush=True)
-        except (json.JSONDecodeError, ValueError) as e:
-            logger.error(f"JSON invalide: {e}")
-            print(json.dumps({"error": "JSON invalide"}), flush=True)
-        except Exception as e:
-            logger.error(f"Erreur inattendue: {e}")
-            print(json.dumps({"error": "Erreur interne"}), flush=True)
+            r = await CLIENT.get(_URL_TELEMETRY[ag_name], headers=_internal_headers(),
+                                 timeout=3)
+        except Exception:
+            breaker_trip(ag_name)
+            return f"  {ag_name}: offline\n"
+        _BREAKER.pop(ag_name, None)
+        try:
+            data = _loads(r.content)
+        except ValueError:
+            return f"  {ag_name}: offline\n"
+    try:
+        tps = data.get("current_tps", 0)
+        peak = data.get("peak_tps", 0)
+        avg = data.get("avg_tps", 0)
+        t_in = data.get("total_tokens_in", 0)
+        t_out = data.get("total_tokens_out", 0)
+        return f"  {ag_name}: {tps:.1f} tok/s (avg: {avg:.1f}, peak: {peak:.1f}) | in: {t_in} out: {t_out}\n"
+    except Exception:
+        return f"  {ag_name}: offline\n"
+
+
+async def _tool_get_telemetry(args: dict) -> dict:
+    # Interrogations en parallèle, lignes dans l'ordre de AGENTS
+    lines = await asyncio.gather(*(_telemetry_line(n) for n in AGENTS))
+    txt = "Télémétrie ACP Agents\n\n" + "".join(lines)
+    return {"content": [{"type": "text", "text": txt}]}
+
+
+async def _tool_get_graph(args: dict) -> dict:
+    agent_name = "code"
+    try:
+        r = await CLIENT.get(
+            _URL_GRAPH[agent_name], timeout=10
+        )
+        data = _loads(r.content)
+        nodes = data.get("nodes", [])
+        edges = data.get("edges", [])
+        parts = [f"Graph ACP: {len(nodes)} noeuds, {len(edges)} arêtes\n\n", "Noeuds:\n"]
+        for n in nodes[:20]:
+            parts.append(f"  [{n['type']}] {n['id']}: {n['label']}\n")
+        parts.append("\nArêtes:\n")
+        for e in edges[:20]:
+            parts.append(f"  {e['source']} —{e['type']}→ {e['target']}\n")
+        if len(nodes) > 20:
+            parts.append(f"\n... et {len(nodes) - 20} noeuds de plus\n")
+        if len(edges) > 20:
+            parts.append(f"... et {len(edges) - 20} arêtes de plus\n")
+        return {"content": [{"type": "text", "text": "".join(parts)}]}
+    except Exception as e:
+        return {"content": [{"type": "text", "text": f"Erreur graph: {e}"}]}
+
+
+_TOOL_HANDLERS = {
+    "list_agents": _tool_list_agents,
+    "discover_agents": _tool_discover_agents,
+    "create_session": _tool_create_session,
+    "session_message": _tool_session_message,
+    "archive_search": _tool_archive_search,
+    "archive_index": _tool_archive_index,
+    "upload_file": _tool_upload_file,
+    "list_files": _tool_list_files,
+    "get_telemetry": _tool_get_telemetry,
+    "get_graph": _tool_get_graph,
+}
+
+# ask_<agent> -> nom de l'agent
+_ASK_TOOLS = {f"ask_{n}": n for n in AGENTS}
+
+
+_INITIALIZE_RESULT = {"protocolVersion": "2024-11-05", "capabilities": {"tools": {}}, "serverInfo": {"name": "acp-agents", "version": "2.0"}}
+
+
+async def _method_initialize(params: dict) -> dict:
+    return _INITIALIZE_RESULT
+
+
+async def _method_tools_list(params: dict) -> dict:
+    return tools_list()
+
+
+async def _method_tools_call(params: dict) -> dict:
+    name = params.get("name", "")
+    args = params.get("arguments", {})
+    handler = _TOOL_HANDLERS.get(name)
+    if handler:
+        return await handler(args)
+    agent = _ASK_TOOLS.get(name)
+    if agent:
+        resp = await call_agent(agent, args.get("message", ""))
+        return {"content": [{"type": "text", "text": resp}]}
+    if name.startswith("ask_"):
+        return {"content": [{"type": "text", "text": f"Agent '{name[4:]}' inconnu"}]}
+    return {"error": f"Outil inconnu: {name}"}
+
+
+_METHOD_HANDLERS = {
+    "initialize": _method_initialize,
+    "tools/list": _method_tools_list,
+    "tools/call": _method_tools_call,
+}
+
+
+async def handle(req):
+    handler = _METHOD_HANDLERS.get(req.get("method", ""))
+    if handler is None:
+        return {"error": "Méthode non supportée"}
+    return await handler(req.get("params", {}))
+
+
+# Réponses d'erreur constantes, sérialisées une fois
+_ERR_INVALID_JSON = _dumps({"error": "JSON invalide"})
+_ERR_INTERNAL = _dumps({"error": "Erreur interne"})
+_ERR_LINE_TOO_LONG = _dumps({"error": "Ligne trop longue"})
+
+# Taille max d'une requête : au-delà, rejet sans décodage ni parsing
+MAX_LINE = 1 << 20
+# Réponses terminées, pas encore écrites : regroupées en un write au prochain tour de boucle
+_READY: list = []
+
+
+def write_line(payload: bytes):
+    """Écrire une ligne JSON sur stdout : payload + newline en un seul write, un flush."""
+    out = sys.stdout.buffer
+    out.write(payload + b"\n")
+    out.flush()
+
+
+async def respond(line: bytes) -> bytes:
+    """Traiter une requête JSON-RPC et renvoyer la réponse sérialisée."""
+    if not line:
+        return _ERR_LINE_TOO_LONG
+    try:
+        req = _loads(line)
+        req_id = req.get("id")
+        if not (isinstance(req_id, (int, str)) and len(str(req_id)) < 256):
+            req_id = None
+        if req.get("method") == "tools/list":
+            return tools_list_json(req_id)
+        resp = await handle(req)
+        if req_id is not None:
+            # Copie : les réponses constantes (catalogue...) ne sont jamais mutées
+            resp = {**resp, "id": req_id}
+        return _dumps(resp)
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.error(f"JSON invalide: {e}")
+        return _ERR_INVALID_JSON
+    except Exception as e:
+        logger.error(f"Erreur inattendue: {e}")
+        return _ERR_INTERNAL
+
+
+def _flush_ready():
+    payload = b"\n".join(_READY)
+    _READY.clear()
+    write_line(payload)
+
+
+async def process_line(line: bytes):
+    """Traiter une requête ; sa réponse part dès qu'elle est prête. Les réponses
+    terminées dans le même tour de boucle sont écrites ensemble."""
+    payload = await respond(line)
+    if not _READY:
+        asyncio.get_running_loop().call_soon(_flush_ready)
+    _READY.append(payload)
+
+
+async def main_async():
+    loop = asyncio.get_running_loop()
+    lines: asyncio.Queue = asyncio.Queue()
+
+    # Lecture stdin dans un thread dédié (fonctionne avec pipe, fichier ou tty).
+    # Lignes brutes en bytes : pas de décodage UTF-8, orjson parse directement.
+    def read_stdin():
+        reader = sys.stdin.buffer
+        while True:
+            line = reader.readline(MAX_LINE + 1)
+            if not line:
+                break
+            if len(line) > MAX_LINE:
+                # Ligne trop longue : jeter le reste sans le garder en mémoire
+                while line and not line.endswith(b"\n"):
+                    line = reader.readline(MAX_LINE)
+                loop.call_soon_threadsafe(lines.put_nowait, b"")
+                continue
+            loop.call_soon_threadsafe(lines.put_nowait, line)
+        loop.call_soon_threadsafe(lines.put_nowait, None)
+
+    threading.Thread(target=read_stdin, daemon=True).start()
+
+    # Une tâche par requête : une requête lente (ask_*) ne retient pas les autres
+    pending = set()
+    while (line := await lines.get()) is not None:
+        task = asyncio.create_task(process_line(line))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    if pending:
+        await asyncio.gather(*pending)
+    await asyncio.sleep(0)  # laisser partir les dernières réponses prêtes
+    await CLIENT.aclose()
+
+
+def main():
+    # Boucle libuv si disponible (optionnel)
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    asyncio.run(main_async())
 
 if __name__ == "__main__":
     main()
@@ -8,12 +8,36 @@ import sys
 import os
 import time
 import signal
+import http.client
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from acp_server import AGENTS, print_banner
 
 processes = []
 
+READY_TIMEOUT = 30     # secondes max pour qu'un agent réponde sur /status
+READY_POLL = 0.1       # intervalle entre deux tentatives
+
+def _wait_ready(name, cfg):
+    """Attendre que l'agent réponde 200 sur /status. Retourne (nom, prêt)."""
+    deadline = time.monotonic() + READY_TIMEOUT
+    conn = http.client.HTTPConnection("localhost", cfg["port"], timeout=1)
+    try:
+        while time.monotonic() < deadline:
+            try:
+                conn.request("GET", "/status")
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status == 200:
+                    return name, True
+            except (OSError, http.client.HTTPException):
+                conn.close()
+            time.sleep(READY_POLL)
+        return name, False
+    finally:
+        conn.close()
+
 def signal_handler(sig, frame):
     """Arrêter tous les processus"""
     print("\n\n🛑 Arrêt de tous les agents...")
@@ -24,7 +48,7 @@ def signal_handler(sig, frame):
 def main():
     print_banner()
 
-    # Démarrer chaque agent
+    # Démarrer tous les agents d'un coup (lancements indépendants)
     for name in AGENTS.keys():
         print(f"🚀 Démarrage de {name}...")
         p = subprocess.Popen(
@@ -33,7 +57,16 @@ def main():
             stderr=subprocess.STDOUT
         )
         processes.append(p)
-        time.sleep(1)  # Attendre un peu entre chaque démarrage
+
+    # Attendre qu'ils soient prêts, en parallèle
+    with ThreadPoolExecutor(max_workers=len(AGENTS)) as ex:
+        futures = [ex.submit(_wait_ready, name, cfg) for name, cfg in AGENTS.items()]
+        for fut in as_completed(futures):
+            name, ready = fut.result()
+            if ready:
+                print(f"   ✓ {name} prêt (port {AGENTS[name]['port']})")
+            else:
+                print(f"   ✗ {name} ne répond pas après {READY_TIMEOUT}s")
 
     print("\n✅ Tous les agents sont en cours d'exécution!")
     print("\n📋 Commandes disponibles:")
@@ -8,20 +8,41 @@ Données récupérées depuis les réponses Ollama (eval_count, eval_duration).
 import time
 import threading
 import logging
-from typing import Dict, List
-from collections import deque
+from array import array
+from typing import Dict, NamedTuple
 
 logger = logging.getLogger("telemetry")
 
 MAX_SAMPLES = 60  # Rolling window
 
 
+class _Sample(NamedTuple):
+    """Un sample de télémétrie (tuple : pas de dict par sample)."""
+    timestamp: float
+    eval_count: int
+    eval_duration_ns: int
+    tps: float
+    prompt_eval_count: int
+    prompt_tps: float
+
+
+_EMPTY_SAMPLE = _Sample(0.0, 0, 0, 0.0, 0, 0.0)
+
+
 class AgentTelemetry:
     """Télémétrie pour un agent individuel."""
 
     def __init__(self, agent_name: str):
         self.agent_name = agent_name
-        self.samples: deque = deque(maxlen=MAX_SAMPLES)
+        # Ring buffer des tps de la fenêtre (seule colonne relue, pour l'éviction)
+        self._tps = array("d", bytes(8 * MAX_SAMPLES))
+        self._head = 0   # prochain slot à écrire
+        self._count = 0  # samples valides (<= MAX_SAMPLES)
+        # Agrégats glissants des tps > 0 de la fenêtre, tenus à jour par record()
+        self._tps_sum = 0.0
+        self._tps_positive_count = 0
+        # Dernier sample, remplacé d'un bloc : lecture sans verrou
+        self._last = _EMPTY_SAMPLE
         self.total_tokens_in = 0
         self.total_tokens_out = 0
         self.total_requests = 0
@@ -45,27 +66,36 @@ class AgentTelemetry:
         if prompt_eval_duration_ns > 0:
             prompt_tps = prompt_eval_count / (prompt_eval_duration_ns / 1e9)
 
-        sample = {
-            "timestamp": time.time(),
-            "eval_count": eval_count,
-            "eval_duration_ns": eval_duration_ns,
-            "tps": round(tps, 2),
-            "prompt_eval_count": prompt_eval_count,
-            "prompt_tps": round(prompt_tps, 2)
-        }
+        sample = _Sample(time.time(), eval_count, eval_duration_ns, round(tps, 2),
+                         prompt_eval_count, round(prompt_tps, 2))
+        tps = sample.tps
 
         with self._lock:
-            self.samples.append(sample)
+            i = self._head
+            if self._count == MAX_SAMPLES:
+                # Le slot écrasé sort de la fenêtre
+                evicted = self._tps[i]
+                if evicted > 0:
+                    self._tps_positive_count -= 1
+                    self._tps_sum = self._tps_sum - evicted if self._tps_positive_count else 0.0
+            if tps > 0:
+                self._tps_sum += tps
+                self._tps_positive_count += 1
+            self._tps[i] = tps
+            self._head = (i + 1) % MAX_SAMPLES
+            if self._count < MAX_SAMPLES:
+                self._count += 1
             self.total_tokens_out += eval_count
             self.total_tokens_in += prompt_eval_count
             self.total_requests += 1
             if tps > self.peak_tps:
                 self.peak_tps = tps
+            self._last = sample
 
     def get_stats(self) -> Dict:
         """Retourner les statistiques de télémétrie."""
         with self._lock:
-            if not self.samples:
+            if not self._count:
                 return {
                     "agent": self.agent_name,
                     "samples": 0,
@@ -77,28 +107,25 @@ class AgentTelemetry:
                     "total_requests": self.total_requests
                 }
 
-            tps_values = [s["tps"] for s in self.samples if s["tps"] > 0]
-            avg_tps = sum(tps_values) / len(tps_values) if tps_values else 0.0
-            current_tps = self.samples[-1]["tps"] if self.samples else 0.0
+            n = self._tps_positive_count
+            avg_tps = self._tps_sum / n if n else 0.0
+            last = self._last._asdict()
 
             return {
                 "agent": self.agent_name,
-                "samples": len(self.samples),
+                "samples": self._count,
                 "avg_tps": round(avg_tps, 2),
                 "peak_tps": round(self.peak_tps, 2),
-                "current_tps": round(current_tps, 2),
+                "current_tps": round(last["tps"], 2),
                 "total_tokens_in": self.total_tokens_in,
                 "total_tokens_out": self.total_tokens_out,
                 "total_requests": self.total_requests,
-                "last_sample": dict(self.samples[-1]) if self.samples else None
+                "last_sample": last
             }
 
     def get_tps_display(self) -> str:
         """Retourner le TPS formaté pour tmux (court)."""
-        with self._lock:
-            if not self.samples:
-                return "0.0"
-            return f"{self.samples[-1]['tps']:.1f}"
+        return f"{self._last.tps:.1f}"
 
 
 class TelemetryRegistry:
@@ -8,7 +8,15 @@ import subprocess
 import json
 import time
 import sys
-import urllib.request
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # orjson optionnel : parsing JSON plus rapide
+    orjson = None
+
+_loads = orjson.loads if orjson else json.loads
 
 SESSION = "agents"
 try:
@@ -30,41 +38,129 @@ AGENTS = [
 ]
 
 
-def tmux(*args):
-    r = subprocess.run(["tmux"] + list(args), capture_output=True, text=True)
-    return r.stdout.strip()
+_LAST_TMUX_ERROR = None
 
+def _tmux(argv) -> bool:
+    """Lancer tmux ; l'erreur est affichée sur stderr (une fois tant qu'elle se répète)."""
+    global _LAST_TMUX_ERROR
+    r = subprocess.run(argv, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if r.returncode == 0:
+        return True
+    err = r.stderr.decode(errors="replace").strip() or f"code {r.returncode}"
+    if err != _LAST_TMUX_ERROR:
+        print(f"tmux: {err}", file=sys.stderr, flush=True)
+        _LAST_TMUX_ERROR = err
+    return False
 
-def setup_tmux():
-    """Configure les pane borders pour la session agents."""
-    tmux("set-option", "-t", SESSION, "pane-border-status", "top")
-    tmux("set-option", "-t", SESSION, "pane-border-lines", "heavy")
-    tmux("set-option", "-t", SESSION, "pane-active-border-style", "fg=green,bold")
-    tmux("set-option", "-t", SESSION, "pane-border-style", "fg=colour240")
-    tmux("set-option", "-t", SESSION, "allow-rename", "off")
-    tmux("set-option", "-t", SESSION, "automatic-rename", "off")
-    tmux("set-option", "-t", SESSION, "pane-border-format",
-         " #{?pane_active,#[fg=colour46 bold bg=colour235],#[fg=green bg=colour235]}#{pane_title} ")
 
+def tmux_batch(commands) -> list:
+    """Exécuter plusieurs commandes tmux en un seul processus (séparées par ';').
 
-def fetch_status(port):
+    tmux abandonne la suite d'une séquence dès qu'une commande échoue (pane fermé...) :
+    dans ce cas, les commandes sont relancées une par une. Retourne le succès de chacune.
+    """
+    if not commands:
+        return []
+    argv = ["tmux"]
+    for cmd in commands:
+        argv.extend(cmd)
+        argv.append(";")
+    argv.pop()
+    if _tmux(argv):
+        return [True] * len(commands)
+    if len(commands) == 1:
+        return [False]
+    return [_tmux(["tmux", *cmd]) for cmd in commands]
+
+
+_CONFIGURED_SESSIONS = set()
+
+def setup_tmux():
+    """Configure les pane borders pour la session agents (une fois par session)."""
+    if SESSION in _CONFIGURED_SESSIONS:
+        return
+    options = [
+        ("pane-border-status", "top"),
+        ("pane-border-lines", "heavy"),
+        ("pane-active-border-style", "fg=green,bold"),
+        ("pane-border-style", "fg=colour240"),
+        ("allow-rename", "off"),
+        ("automatic-rename", "off"),
+        ("pane-border-format",
+         " #{?pane_active,#[fg=colour46 bold bg=colour235],#[fg=green bg=colour235]}#{pane_title} "),
+    ]
+    # Session pas encore lancée : on réessaiera au prochain tour
+    if all(tmux_batch([("set-option", "-t", SESSION, name, value) for name, value in options])):
+        _CONFIGURED_SESSIONS.add(SESSION)
+
+
+# Une connexion HTTP persistante par port (keep-alive si l'agent le permet).
+# Chaque agent est interrogé par un seul worker à la fois : pas de partage entre threads.
+_CONNS = {}
+
+def _get(port, path):
+    """(statut HTTP, corps) d'un GET, ou None si l'agent est injoignable."""
+    conn = _CONNS.get(port)
+    if conn is None:
+        conn = _CONNS[port] = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
     try:
-        req = urllib.request.Request(f"http://127.0.0.1:{port}/status")
-        with urllib.request.urlopen(req, timeout=2) as resp:
-            return json.loads(resp.read())
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        return resp.status, resp.read()
     except Exception:
+        conn.close()
+        _CONNS.pop(port, None)
         return None
 
 
-def fetch_telemetry(port):
+def _json_body(r):
+    """Corps JSON d'une réponse 200 de _get(), sinon None."""
+    if r is None or r[0] != 200:
+        return None
     try:
-        req = urllib.request.Request(f"http://127.0.0.1:{port}/telemetry")
-        with urllib.request.urlopen(req, timeout=2) as resp:
-            return json.loads(resp.read())
-    except Exception:
+        return _loads(r[1])
+    except ValueError:
         return None
 
 
+def _get_json(port, path):
+    return _json_body(_get(port, path))
+
+
+def fetch_status(port):
+    return _get_json(port, "/status")
+
+
+def fetch_telemetry(port):
+    return _get_json(port, "/telemetry")
+
+
+# Ports dont l'agent ne connaît pas /snapshot (ancienne version) : deux requêtes
+_NO_SNAPSHOT = set()
+
+def fetch_agent(port):
+    """(status, telemetry) d'un agent : /snapshot en un aller-retour si disponible."""
+    if port not in _NO_SNAPSHOT:
+        r = _get(port, "/snapshot")
+        if r is None:
+            return None, None
+        if r[0] != 404:
+            snap = _json_body(r)
+            if not snap:
+                return None, None
+            return snap.get("status"), snap.get("telemetry")
+        _NO_SNAPSHOT.add(port)
+    return fetch_status(port), fetch_telemetry(port)
+
+
+# Un worker par agent, tous les agents en parallèle
+_POOL = ThreadPoolExecutor(max_workers=len(AGENTS))
+
+def fetch_all():
+    """Récupérer (status, telemetry) de tous les agents, dans l'ordre de AGENTS."""
+    return list(_POOL.map(fetch_agent, [a["port"] for a in AGENTS]))
+
+
 def format_tokens(t):
     if t >= 1_000_000:
         return f"{t / 1_000_000:.1f}M"
@@ -73,9 +169,11 @@ def format_tokens(t):
     return str(t)
 
 
+# Les 11 barres possibles, précalculées
+_BARS = tuple("\u2588" * i + "\u2591" * (10 - i) for i in range(11))
+
 def make_bar(pct):
-    filled = min(max(int(pct / 10), 0), 10)
-    return "\u2588" * filled + "\u2591" * (10 - filled)
+    return _BARS[min(max(int(pct / 10), 0), 10)]
 
 
 def indicator(pct):
@@ -102,25 +200,35 @@ def build_title(agent, data, telemetry=None):
     # TPS depuis telemetry
     tps_str = ""
     if telemetry:
-        tps = telemetry.get("current_tps", 0)
+        # Arrondi à 0.5 t/s : le bruit ne change pas le titre
+        tps = round(telemetry.get("current_tps", 0) * 2) / 2
         if tps > 0:
             tps_str = f" | \u26a1{tps:.1f}t/s"
 
     return f"{agent['model_short']} | {indicator(pct)} {tok_d}/{ctx_k} ({pct}%) {bar}{tps_str} | \U0001f4e8 {msgs} | {agent['name']}"
 
 
+# Dernier titre envoyé par pane : pas d'appel tmux si rien n'a changé
+_LAST_TITLE = {}
+
 def main():
-    setup_tmux()
     print(f"Monitor actif — 9 agents — refresh {INTERVAL}s — Ctrl+C pour arrêter", flush=True)
 
     try:
         while True:
-            for agent in AGENTS:
-                target = f"{SESSION}:0.{agent['pane']}"
-                data = fetch_status(agent["port"])
-                telemetry = fetch_telemetry(agent["port"])
+            setup_tmux()
+            commands, titles = [], []
+            for agent, (data, telemetry) in zip(AGENTS, fetch_all()):
                 title = build_title(agent, data, telemetry)
-                tmux("select-pane", "-t", target, "-T", title)
+                if _LAST_TITLE.get(agent["pane"]) == title:
+                    continue
+                target = f"{SESSION}:0.{agent['pane']}"
+                commands.append(("select-pane", "-t", target, "-T", title))
+                titles.append((agent["pane"], title))
+            # Titre mémorisé seulement s'il a bien été appliqué : sinon renvoyé au tour suivant
+            for (pane, title), ok in zip(titles, tmux_batch(commands)):
+                if ok:
+                    _LAST_TITLE[pane] = title
 
             time.sleep(INTERVAL)
     except KeyboardInterrupt:
@@ -2,155 +2,757 @@
 """
 Archive vectorielle pour ACP Agents
 Utilise Ollama Embeddings API pour indexer et rechercher les réponses des agents.
-Stockage JSON sur disque (state/vector_store.json).
+Stockage binaire append-only sur disque : state/vector_store.f32 (lignes float32)
++ state/vector_store.jsonl (métadonnées, une ligne par entrée).
 """
 
 import json
 import os
+import asyncio
+import atexit
 import math
 import time
 import hashlib
+import heapq
 import logging
 import threading
-from typing import List, Dict, Optional
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import AsyncIterator, Iterable, List, Dict, Optional, Sequence, Tuple
 
 import httpx
 
+try:
+    import orjson
+except ImportError:  # orjson optionnel : (dé)sérialisation JSON plus rapide
+    orjson = None
+
+if orjson:
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+else:
+    _loads = json.loads
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+try:
+    import fcntl
+except ImportError:  # pas de fcntl (Windows) : pas de verrou inter-processus sur le log
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:  # numpy optionnel : produits scalaires vectorisés en C
+    np = None
+
+try:
+    import numba
+except ImportError:  # numba optionnel : noyau de scoring compilé (JIT, multi-cœurs)
+    numba = None
+else:
+    # Les recherches tournent hors du thread principal (boucle asyncio partagée) : avec
+    # la couche TBB, le processus bloque alors à la sortie. OpenMP d'abord, sauf choix explicite.
+    if "NUMBA_THREADING_LAYER" not in os.environ and "NUMBA_THREADING_LAYER_PRIORITY" not in os.environ:
+        numba.config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+
+try:
+    import simsimd as _simd
+except ImportError:  # simsimd optionnel : noyaux SIMD écrits à la main (AVX-512, NEON)
+    _simd = None
+
 logger = logging.getLogger("vector-store")
 
 # Constantes
 DEFAULT_EMBED_MODEL = "nomic-embed-text"
 MAX_TEXT_LENGTH = 8000
 MAX_ENTRIES = 10_000
+EMBED_BATCH_SIZE = 32  # textes par requête /api/embed dans index_many
+EMBED_CACHE_SIZE = 512   # embeddings gardés en mémoire (LRU, clé = texte tronqué)
+SEARCH_CACHE_SIZE = 256  # résultats de recherche gardés (LRU + TTL)
+SEARCH_CACHE_TTL = 300   # secondes
+SEARCH_THREADS = os.cpu_count() or 1  # balayage découpé en blocs sur ce nombre de threads...
+PARALLEL_MIN_ROWS = 4096              # ...à partir de ce nombre de lignes
+# Quantification int8 optionnelle (numpy requis) : le balayage lit 4× moins d'octets,
+# les QUANT_RERANK × top_k meilleurs candidats sont re-scorés exactement en float32
+QUANTIZE = os.environ.get("VECTOR_STORE_QUANTIZE", "").lower() == "int8"
+QUANT_RERANK = 4
 STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state")
-STORE_PATH = os.path.join(STORE_DIR, "vector_store.json")
+STORE_PATH = os.path.join(STORE_DIR, "vector_store.json")  # base des fichiers .f32/.jsonl
+SAVE_EVERY = 64    # écriture groupée : au plus SAVE_EVERY ajouts en attente...
+SAVE_DELAY = 5.0   # ...ou SAVE_DELAY secondes après le premier
+COMPACT_FACTOR = 2  # réécriture du log quand il dépasse COMPACT_FACTOR × MAX_ENTRIES lignes
 OLLAMA_API = os.environ.get("OLLAMA_API", "http://localhost:11434/api")
 
 
-def cosine_similarity(a: List[float], b: List[float]) -> float:
-    """Cosine similarity entre deux vecteurs."""
+def cosine_similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    """Cosine similarity entre deux vecteurs (listes, array('f') ou tableaux numpy)."""
     if len(a) != len(b):
         return 0.0
-    dot = sum(x * y for x, y in zip(a, b))
-    norm_a = math.sqrt(sum(x * x for x in a))
-    norm_b = math.sqrt(sum(x * x for x in b))
-    if norm_a == 0 or norm_b == 0:
+    if np is not None:
+        a = np.asarray(a, dtype=np.float32)
+        b = np.asarray(b, dtype=np.float32)
+        # Une seule racine pour les deux normes
+        denom = math.sqrt(float(np.vdot(a, a)) * float(np.vdot(b, b)))
+        if denom == 0:
+            return 0.0
+        return float(np.dot(a, b)) / denom
+    # Un seul passage sur les deux vecteurs (au lieu de trois générateurs), une seule racine
+    dot = na = nb = 0.0
+    for x, y in zip(a, b):
+        dot += x * y
+        na += x * x
+        nb += y * y
+    denom = math.sqrt(na * nb)
+    if denom == 0:
         return 0.0
-    return dot / (norm_a * norm_b)
+    return dot / denom
+
+
+def normalize(v):
+    """Vecteur L2-normalisé (float32 : numpy, sinon array('f')). Le vecteur nul reste nul."""
+    if np is not None:
+        v = np.asarray(v, dtype=np.float32)
+        n = float(np.linalg.norm(v))
+        return v / n if n else v
+    n = math.sqrt(sum(x * x for x in v))
+    return array("f", [x / n for x in v] if n else v)
+
+
+if numba is not None and np is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _score_all(mat, q):
+        """Produit scalaire de chaque ligne de `mat` avec `q` (vecteurs déjà normalisés)."""
+        n, d = mat.shape
+        out = np.empty(n, dtype=np.float32)
+        for i in numba.prange(n):
+            s = np.float32(0.0)
+            for j in range(d):
+                s += mat[i, j] * q[j]
+            out[i] = s
+        return out
+
+    @numba.njit(parallel=True, cache=True)
+    def _score_all_i8(mat, q):
+        """Produits scalaires entiers (accumulation int32) des lignes int8 avec `q` int8."""
+        n, d = mat.shape
+        out = np.empty(n, dtype=np.int32)
+        for i in numba.prange(n):
+            s = 0
+            for j in range(d):
+                s += np.int32(mat[i, j]) * np.int32(q[j])
+            out[i] = s
+        return out
+else:
+    _score_all = None
+    _score_all_i8 = None
+
+
+def score_rows(mat, q):
+    """Produits scalaires des lignes de `mat` avec `q` : SimSIMD, noyau numba ou BLAS.
+
+    Lignes et requête étant normalisées, la métrique `dot` suffit (pas de normes à recalculer).
+    """
+    if _simd is not None:
+        return np.asarray(_simd.cdist(q.reshape(1, -1), mat, metric="dot"))[0]
+    if mat.dtype == np.int8:
+        if _score_all_i8 is not None:
+            return _score_all_i8(mat, q)
+        return mat.astype(np.int32) @ q.astype(np.int32)
+    if _score_all is not None:
+        return _score_all(mat, q)
+    return mat @ q
+
+
+def quantize_i8(v):
+    """(vecteur int8, échelle) avec v ≈ q8 / échelle ; échelle par vecteur = 127 / max|v|."""
+    m = float(np.abs(v).max()) if len(v) else 0.0
+    scale = 127.0 / m if m else 1.0
+    return np.round(v * scale).astype(np.int8), scale
+
+
+def _row_bytes(row) -> bytes:
+    """Ligne d'embedding en float32 brut (format du fichier .f32)."""
+    if np is not None:
+        return np.asarray(row, dtype=np.float32).tobytes()
+    return (row if isinstance(row, array) else array("f", row)).tobytes()
+
+
+def _text_hash(text: str) -> str:
+    """Empreinte du texte stocké (tronqué), pour dédupliquer les insertions."""
+    return hashlib.blake2b(text[:MAX_TEXT_LENGTH].encode(), digest_size=16).hexdigest()
+
+
+def top_k_indices(scores, k: int, head: int = 0) -> List[int]:
+    """Indices des k meilleurs scores, par score décroissant (ex-aequo : ordre d'insertion,
+    le tampon circulaire commençant au slot `head`).
+
+    argpartition en O(N) puis tri des k candidats seulement.
+    """
+    n = len(scores)
+    if k >= n:
+        idx = np.arange(n)
+    else:
+        # k-ième meilleur score, puis tous les candidats >= (ex-aequo à la frontière inclus)
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        idx = np.flatnonzero(scores >= kth)
+    return idx[np.lexsort(((idx - head) % n, -scores[idx]))][:k].tolist()
 
 
 class VectorStore:
-    """Store vectoriel JSON-backed avec embeddings Ollama."""
+    """Store vectoriel avec embeddings Ollama, persisté en log binaire append-only.
+
+    Stockage en colonnes : `_meta` (id, texte, metadata...) et une matrice
+    d'embeddings `_matrix` (float32 N×D avec numpy, sinon liste d'array('f')).
+    Les lignes sont L2-normalisées à l'insertion : cosine = produit scalaire.
+    """
 
     def __init__(self, store_path: str = STORE_PATH, embed_model: str = DEFAULT_EMBED_MODEL):
         self.store_path = store_path
+        base = os.path.splitext(store_path)[0]
+        self._vec_path = base + ".f32"      # lignes normalisées, float32 brut
+        self._meta_path = base + ".jsonl"   # en-tête {"dim": D} puis une ligne par entrée
+        self._legacy_path = base + ".json"  # ancien format JSON monolithique (migré)
+        # Verrou partagé par les processus agents ; contient les tailles validées du log
+        self._lock_path = base + ".lock"
+        # Ajouts en attente d'écriture dans le log : (ligne float32, métadonnées)
+        self._pending: List[Tuple[bytes, bytes]] = []
+        self._save_timer: Optional[threading.Timer] = None  # écriture différée programmée
         self.embed_model = embed_model
         self._lock = threading.Lock()
-        self.entries: List[Dict] = []
+        self._meta: List[Dict] = []
+        self._matrix = None      # lignes 0.._n-1 valides (capacité >= _n avec numpy)
+        self._dim = 0
+        # Tampon circulaire une fois plein : slot de l'entrée la plus ancienne
+        self._head = 0
+        self._total_chars = 0    # somme des text_length, tenue à jour (stats() en O(1))
+        self._text_hash_to_id: Dict[str, str] = {}  # déduplication des textes déjà indexés
+        # Copie int8 de la matrice + inverses des échelles (si QUANTIZE)
+        self._matrix_i8 = None
+        self._inv_scales = None
+        # Clients HTTP persistants (keep-alive vers Ollama) : boucle asyncio -> (portée, client)
+        self._clients: Dict[asyncio.AbstractEventLoop, Tuple[AsyncIterator, httpx.AsyncClient]] = {}
+        # Caches LRU (protégés par _lock) ; les résultats de recherche sont
+        # invalidés à chaque insertion
+        self._emb_cache: "OrderedDict[str, Sequence[float]]" = OrderedDict()
+        self._search_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._pool: Optional[ThreadPoolExecutor] = None  # créé au premier balayage parallèle
         self._load()
+        atexit.register(self.flush)
+
+    @property
+    def _n(self) -> int:
+        return len(self._meta)
+
+    def _reset_vectors(self, dim: int, capacity: int = 0):
+        self._dim = dim
+        self._head = 0
+        self._total_chars = 0
+        self._text_hash_to_id = {}
+        if np is not None:
+            self._matrix = np.zeros((max(capacity, 16), dim), dtype=np.float32)
+            if QUANTIZE:
+                self._matrix_i8 = np.zeros(self._matrix.shape, dtype=np.int8)
+                self._inv_scales = np.zeros(len(self._matrix), dtype=np.float32)
+        else:
+            self._matrix = []
+
+    def _append_row(self, embedding, meta: Dict, normalized: bool = False) -> int:
+        """Ajouter une ligne, normalisée si besoin ; une fois MAX_ENTRIES atteint, écrase
+        la plus ancienne en O(1). Retourne le slot utilisé (appeler avec _lock)."""
+        if not normalized:
+            embedding = normalize(embedding)
+        n = self._n
+        full = n >= MAX_ENTRIES
+        slot = self._head if full else n
+        if np is not None:
+            if not full and n == len(self._matrix):
+                # Croissance par doublement (plafonnée) : pas de vstack à chaque insertion
+                cap = max(min(2 * n, MAX_ENTRIES), n + 1)
+                self._matrix = np.resize(self._matrix, (cap, self._dim))
+                if self._matrix_i8 is not None:
+                    self._matrix_i8 = np.resize(self._matrix_i8, (cap, self._dim))
+                    self._inv_scales = np.resize(self._inv_scales, cap)
+            self._matrix[slot] = embedding
+            if self._matrix_i8 is not None:
+                self._matrix_i8[slot], scale = quantize_i8(self._matrix[slot])
+                self._inv_scales[slot] = 1.0 / scale
+        else:
+            # Sans numpy : lignes array('f') compactes (4 octets par float au lieu d'un objet float)
+            row = embedding if isinstance(embedding, array) else array("f", embedding)
+            if full:
+                self._matrix[slot] = row
+            else:
+                self._matrix.append(row)
+        self._total_chars += meta.get("text_length", 0)
+        if full:
+            old = self._meta[slot]
+            self._total_chars -= old.get("text_length", 0)
+            old_hash = _text_hash(old.get("text", ""))
+            if self._text_hash_to_id.get(old_hash) == old.get("id"):
+                del self._text_hash_to_id[old_hash]
+            self._meta[slot] = meta
+            self._head = (slot + 1) % n
+        else:
+            self._meta.append(meta)
+        self._text_hash_to_id[_text_hash(meta.get("text", ""))] = meta.get("id")
+        return slot
+
+    def _slots(self) -> List[int]:
+        """Slots dans l'ordre d'insertion (du plus ancien au plus récent)."""
+        return list(range(self._head, self._n)) + list(range(self._head))
 
     def _load(self):
-        """Charger le store depuis le disque."""
-        if os.path.exists(self.store_path):
+        """Charger le store depuis le log binaire (ou migrer l'ancien JSON)."""
+        self._meta = []
+        self._reset_vectors(0)
+        with self._file_lock() as lock:
+            if not os.path.exists(self._meta_path):
+                if os.path.exists(self._legacy_path):
+                    self._load_legacy(lock)
+                return
             try:
-                with open(self.store_path, 'r') as f:
-                    data = json.load(f)
-                self.entries = data.get("entries", [])
-            except (json.JSONDecodeError, IOError) as e:
+                consistent = self._check_log(lock)
+                dim, lines, vec, clean = self._read_log()
+            except (OSError, ValueError, KeyError, TypeError) as e:
                 logger.error(f"Erreur chargement vector store: {e}")
-                self.entries = []
+                return
+            metas = []
+            for line in lines:
+                try:
+                    metas.append(_loads(line))
+                except ValueError:
+                    break  # ligne corrompue : on garde ce qui précède
+            n = len(metas)
+            start = max(0, n - MAX_ENTRIES)
+            if np is not None:
+                rows = np.frombuffer(vec, dtype=np.float32)
+            else:
+                rows = array("f")
+                rows.frombytes(vec)
+            self._reset_vectors(dim, n - start)
+            for i in range(start, n):
+                self._append_row(rows[i * dim:(i + 1) * dim], metas[i], normalized=True)
+            # Log réparé (arrêt brutal) ou trop long : repartir d'un log compact
+            if not consistent:
+                logger.warning("Log du vector store incohérent, réécrit avec les entrées lisibles")
+            if start or not consistent or not clean or n != len(lines):
+                row_size = 4 * dim
+                self._write_log(lock, dim, lines[start:n], vec[start * row_size:n * row_size])
+
+    def _load_legacy(self, lock):
+        """Migrer state/vector_store.json vers le log binaire (l'original devient .json.bak)."""
+        try:
+            with open(self._legacy_path, 'rb') as f:
+                data = _loads(f.read())
+        except (ValueError, IOError) as e:
+            logger.error(f"Erreur chargement vector store: {e}")
+            return
+        entries = [e for e in data.get("entries", []) if e.get("embedding")]
+        if not entries:
+            return
+        # Dimension de référence : celle du modèle le plus récent
+        dim = len(entries[-1]["embedding"])
+        kept = [e for e in entries if len(e["embedding"]) == dim][-MAX_ENTRIES:]
+        if len(kept) != len(entries):
+            logger.warning(f"{len(entries) - len(kept)} entrées ignorées (dimension différente ou store plein)")
+        self._reset_vectors(dim, len(kept))
+        # Fichiers antérieurs à la normalisation : normalisés une fois au chargement
+        normalized = bool(data.get("normalized"))
+        for e in kept:
+            emb = e.pop("embedding")
+            self._append_row(emb, e, normalized)
+        self._write_log(lock, dim, [_dumps(m) for m in self._meta],
+                        b"".join(_row_bytes(self._matrix[i]) for i in range(self._n)))
+        os.replace(self._legacy_path, self._legacy_path + ".bak")
+
+    @contextmanager
+    def _file_lock(self):
+        """Verrou exclusif inter-processus : tous les agents lancés par start_all.py
+        partagent les fichiers du log. Le fichier verrou contient aussi les tailles
+        validées des deux fichiers (voir _commit)."""
+        os.makedirs(os.path.dirname(self._lock_path) or ".", exist_ok=True)
+        open(self._lock_path, 'ab').close()
+        with open(self._lock_path, 'r+b') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield lock  # fermeture du fichier = libération du verrou
+
+    def _commit(self, lock):
+        """Valider l'état actuel du log : tailles des deux fichiers, écrites en dernier."""
+        lock.seek(0)
+        lock.write(_dumps({"vec": os.path.getsize(self._vec_path), "meta": os.path.getsize(self._meta_path)}))
+        lock.truncate()
+        lock.flush()
+
+    def _check_log(self, lock) -> bool:
+        """Ramener le log à son dernier état validé (ajout interrompu entre les deux
+        fichiers). Faux si cet état est inconnu : il faut alors le relire en entier."""
+        lock.seek(0)
+        try:
+            rec = _loads(lock.read())
+            vec_ok, meta_ok = rec["vec"], rec["meta"]
+        except (ValueError, KeyError, TypeError):
+            return False
+        vec_size = os.path.getsize(self._vec_path) if os.path.exists(self._vec_path) else 0
+        meta_size = os.path.getsize(self._meta_path)
+        if vec_ok > vec_size or meta_ok > meta_size:
+            return False
+        if vec_size != vec_ok or meta_size != meta_ok:
+            os.truncate(self._vec_path, vec_ok)
+            os.truncate(self._meta_path, meta_ok)
+        return True
+
+    def _read_log(self):
+        """(dim, lignes de métadonnées, octets des vecteurs, fin de fichiers intacte),
+        tronqués au nombre de lignes présentes dans les deux fichiers (appeler avec _file_lock)."""
+        with open(self._meta_path, 'rb') as f:
+            dim = _loads(f.readline())["dim"]
+            lines = f.read().split(b"\n")
+        vec = b""
+        if os.path.exists(self._vec_path):
+            with open(self._vec_path, 'rb') as f:
+                vec = f.read()
+        tail = lines.pop()  # vide si le fichier se termine par un saut de ligne
+        row_size = 4 * dim
+        n = min(len(lines), len(vec) // row_size) if dim else 0
+        clean = not tail and n == len(lines) and len(vec) == n * row_size
+        return dim, lines[:n], vec[:n * row_size], clean
+
+    def _write_log(self, lock, dim: int, lines: List[bytes], vec: bytes):
+        """Réécrire les deux fichiers du log puis valider (appeler avec _file_lock)."""
+        # État validé effacé d'abord : un arrêt entre les deux remplacements est détecté
+        lock.seek(0)
+        lock.truncate()
+        header = _dumps({"dim": dim}) + b"\n"
+        for path, data in (
+            (self._vec_path, vec),
+            (self._meta_path, header + b"".join(line + b"\n" for line in lines)),
+        ):
+            with open(path + ".tmp", 'wb') as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        self._commit(lock)
 
     def _save(self):
-        """Sauvegarder le store sur disque (atomique, appeler avec _lock)."""
-        os.makedirs(os.path.dirname(self.store_path), exist_ok=True)
-        tmp_path = self.store_path + ".tmp"
-        with open(tmp_path, 'w') as f:
-            json.dump({"entries": self.entries, "count": len(self.entries)}, f, ensure_ascii=False)
-        os.replace(tmp_path, self.store_path)
-
-    async def get_embedding(self, text: str) -> Optional[List[float]]:
-        """Obtenir l'embedding d'un texte via Ollama POST /api/embed."""
+        """Écrire les ajouts en attente en fin de log, sous verrou inter-processus (appeler avec _lock)."""
+        if not self._pending:
+            return
+        lines = [line for _, line in self._pending]
+        vec = b"".join(row for row, _ in self._pending)
+        self._pending = []
+        with self._file_lock() as lock:
+            if not os.path.exists(self._meta_path):
+                self._write_log(lock, self._dim, lines, vec)
+                return
+            with open(self._meta_path, 'rb') as f:
+                disk_dim = _loads(f.readline())["dim"]
+            consistent = self._check_log(lock)
+            # Lignes présentes sur disque, y compris celles ajoutées par les autres processus
+            disk_rows = os.path.getsize(self._vec_path) // (4 * disk_dim) if disk_dim else 0
+            if disk_dim != self._dim:
+                if disk_rows:
+                    logger.warning(f"{len(lines)} entrées non sauvegardées : log sur disque en dimension {disk_dim}")
+                else:
+                    self._write_log(lock, self._dim, lines, vec)
+            elif not consistent or disk_rows + len(lines) > COMPACT_FACTOR * MAX_ENTRIES:
+                self._compact(lock, lines, vec)
+            else:
+                # O(D) par entrée : seules les nouvelles lignes sont écrites
+                with open(self._vec_path, 'ab') as fv, open(self._meta_path, 'ab') as fm:
+                    fv.write(vec)
+                    fm.write(b"".join(line + b"\n" for line in lines))
+                self._commit(lock)
+
+    def _compact(self, lock, lines: List[bytes], vec: bytes):
+        """Réécrire le log depuis le disque (entrées de tous les processus) + les ajouts
+        en attente, en ne gardant que les MAX_ENTRIES plus récentes (appeler avec _file_lock)."""
+        dim, disk_lines, disk_vec, _ = self._read_log()
+        lines = disk_lines + lines
+        start = max(0, len(lines) - MAX_ENTRIES)
+        self._write_log(lock, dim, lines[start:], (disk_vec + vec)[start * 4 * dim:])
+
+    def _save_soon(self):
+        """Écriture groupée : tout de suite si SAVE_EVERY ajouts attendent, sinon après
+        SAVE_DELAY secondes dans un timer (hors boucle asyncio). Appeler avec _lock."""
+        if len(self._pending) >= SAVE_EVERY:
+            self._save()
+        elif self._save_timer is None:
+            self._save_timer = threading.Timer(SAVE_DELAY, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Écrire immédiatement les ajouts en attente sur disque."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            self._save()
+
+    @staticmethod
+    async def _client_scope():
+        """Client HTTP lié à une boucle : asyncio finalise ce générateur avant de fermer
+        la boucle (loop.shutdown_asyncgens, appelé par asyncio.run), ce qui ferme le client."""
+        client = httpx.AsyncClient(
+            base_url=OLLAMA_API, timeout=30,
+            limits=httpx.Limits(max_keepalive_connections=8)
+        )
+        try:
+            yield client
+        finally:
+            await client.aclose()
+
+    async def _http(self) -> httpx.AsyncClient:
+        """Client HTTP persistant de la boucle asyncio courante."""
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(loop)
+        if entry is None:
+            scope = self._client_scope()
+            entry = (scope, await scope.__anext__())
+            with self._lock:
+                # Boucles fermées : leur client a été fermé avec elles
+                for closed in [l for l in self._clients if l.is_closed()]:
+                    del self._clients[closed]
+                self._clients[loop] = entry
+        return entry[1]
+
+    async def aclose(self):
+        """Fermer le client HTTP de la boucle courante."""
+        with self._lock:
+            entry = self._clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].aclose()
+
+    async def get_embedding(self, text: str) -> Optional[Sequence[float]]:
+        """Obtenir l'embedding d'un texte via Ollama POST /api/embed (avec cache LRU).
+        Sans numpy, l'embedding est un array('f') compact plutôt qu'une liste."""
         text = text[:MAX_TEXT_LENGTH]
+        with self._lock:
+            cached = self._emb_cache.get(text)
+            if cached is not None:
+                self._emb_cache.move_to_end(text)
+                return cached
+        embedding = await self._fetch_embedding(text)
+        if embedding is not None:
+            if np is None:
+                embedding = array("f", embedding)
+            with self._lock:
+                self._emb_cache[text] = embedding
+                if len(self._emb_cache) > EMBED_CACHE_SIZE:
+                    self._emb_cache.popitem(last=False)
+        return embedding
+
+    async def _fetch_embedding(self, text: str) -> Optional[List[float]]:
+        """Appel Ollama sans cache."""
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
-                # API Ollama standard
-                resp = await client.post(
-                    f"{OLLAMA_API}/embed",
-                    json={"model": self.embed_model, "input": text}
-                )
-                resp.raise_for_status()
-                data = resp.json()
-                embeddings = data.get("embeddings", [])
-                if embeddings and len(embeddings) > 0:
-                    return embeddings[0]
-                # Fallback ancien format
-                embedding = data.get("embedding")
-                if embedding:
-                    return embedding
+            # API Ollama standard
+            client = await self._http()
+            resp = await client.post(
+                "/embed",
+                content=_dumps({"model": self.embed_model, "input": text}),
+                headers=_JSON_HEADERS
+            )
+            resp.raise_for_status()
+            data = _loads(resp.content)
+            embeddings = data.get("embeddings", [])
+            if embeddings and len(embeddings) > 0:
+                return embeddings[0]
+            # Fallback ancien format
+            embedding = data.get("embedding")
+            if embedding:
+                return embedding
+            return None
+        except Exception:
+            return None
+
+    async def get_embeddings_batch(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Embeddings de plusieurs textes en une seule requête POST /api/embed (input liste)."""
+        if not texts:
+            return []
+        try:
+            client = await self._http()
+            resp = await client.post(
+                "/embed",
+                content=_dumps({"model": self.embed_model, "input": [t[:MAX_TEXT_LENGTH] for t in texts]}),
+                headers=_JSON_HEADERS,
+                timeout=120
+            )
+            resp.raise_for_status()
+            embeddings = _loads(resp.content).get("embeddings", [])
+            if len(embeddings) != len(texts):
                 return None
+            return embeddings
         except Exception:
             return None
 
+    def _insert(self, text: str, embedding, metadata: Optional[Dict]) -> Optional[str]:
+        """Ajouter une entrée, avec éviction si plein (appeler avec _lock, sans _save).
+        Un texte déjà présent n'est pas réinséré : son ID existant est retourné.
+        Un embedding d'une autre dimension que le store est refusé (None)."""
+        existing = self._text_hash_to_id.get(_text_hash(text))
+        if existing is not None:
+            return existing
+        if len(embedding) != self._dim:
+            if self._n:
+                # Autre modèle d'embedding : vecteurs non comparables, l'archive n'est pas touchée
+                logger.warning(f"Embedding de dimension {len(embedding)} refusé (store en dimension {self._dim})")
+                return None
+            # Store vide : la première entrée fixe la dimension
+            self._reset_vectors(len(embedding))
+        self._search_cache.clear()
+        if self._n >= MAX_ENTRIES:
+            logger.warning("Store plein, suppression du plus ancien")
+
+        entry_id = hashlib.blake2b(f"{text[:200]}{time.time()}".encode(), digest_size=8).hexdigest()
+        slot = self._append_row(embedding, {
+            "id": entry_id,
+            "text": text[:MAX_TEXT_LENGTH],
+            "metadata": metadata or {},
+            "timestamp": time.time(),
+            "text_length": len(text)
+        })
+        self._pending.append((_row_bytes(self._matrix[slot]), _dumps(self._meta[slot])))
+        return entry_id
+
     async def index(self, text: str, metadata: Optional[Dict] = None) -> Optional[str]:
         """Indexer un texte : générer embedding + stocker. Retourne l'ID ou None."""
         if not text or not text.strip():
             return None
-        if len(self.entries) >= MAX_ENTRIES:
-            logger.warning("Store plein, suppression du plus ancien")
-            with self._lock:
-                self.entries = self.entries[1:]
+        with self._lock:
+            existing = self._text_hash_to_id.get(_text_hash(text))
+        if existing is not None:
+            return existing  # déjà indexé : pas d'appel embedding
 
         embedding = await self.get_embedding(text)
         if embedding is None:
             return None
 
-        entry_id = hashlib.sha256(f"{text[:200]}{time.time()}".encode()).hexdigest()[:16]
-        entry = {
-            "id": entry_id,
-            "text": text[:MAX_TEXT_LENGTH],
-            "embedding": embedding,
-            "metadata": metadata or {},
-            "timestamp": time.time(),
-            "text_length": len(text)
-        }
-
         with self._lock:
-            self.entries.append(entry)
-            self._save()
+            entry_id = self._insert(text, embedding, metadata)
+            self._save_soon()
 
         return entry_id
 
+    async def index_many(self, items: Iterable[Tuple[str, Optional[Dict]]]) -> List[Optional[str]]:
+        """Indexer plusieurs (texte, metadata) : embeddings par lots de EMBED_BATCH_SIZE,
+        une seule sauvegarde. Retourne les IDs dans l'ordre (None si échec ou texte vide)."""
+        ids: List[Optional[str]] = []
+        added = False
+        it = iter(items)
+        while True:
+            batch = list(islice(it, EMBED_BATCH_SIZE))
+            if not batch:
+                break
+            batch_ids: List[Optional[str]] = [None] * len(batch)
+            slots = []
+            with self._lock:
+                for i, (text, _) in enumerate(batch):
+                    if text and text.strip():
+                        batch_ids[i] = self._text_hash_to_id.get(_text_hash(text))
+                        if batch_ids[i] is None:
+                            slots.append(i)
+            embeddings = await self.get_embeddings_batch([batch[i][0] for i in slots]) if slots else None
+            if embeddings:
+                with self._lock:
+                    for i, emb in zip(slots, embeddings):
+                        text, metadata = batch[i]
+                        batch_ids[i] = self._insert(text, emb, metadata)
+                added = True
+            ids.extend(batch_ids)
+        if added:
+            with self._lock:
+                self._save()
+        return ids
+
     async def search(self, query: str, top_k: int = 5) -> List[Dict]:
         """Rechercher les textes les plus similaires à la query."""
         top_k = min(max(top_k, 1), 50)
+        key = (query, top_k)
+        with self._lock:
+            hit = self._search_cache.get(key)
+            if hit is not None and time.monotonic() - hit[0] < SEARCH_CACHE_TTL:
+                self._search_cache.move_to_end(key)
+                return list(hit[1])
+
         query_embedding = await self.get_embedding(query)
         if query_embedding is None:
             return []
 
-        scored = []
-        for entry in self.entries:
-            emb = entry.get("embedding")
-            if emb:
-                score = cosine_similarity(query_embedding, emb)
-                scored.append({
-                    "id": entry["id"],
-                    "text": entry["text"][:500],
-                    "score": round(score, 4),
-                    "metadata": entry.get("metadata", {}),
-                    "timestamp": entry.get("timestamp")
-                })
-
-        scored.sort(key=lambda x: x["score"], reverse=True)
-        return scored[:top_k]
+        with self._lock:
+            n, head = self._n, self._head
+            if not n or len(query_embedding) != self._dim:
+                return []
+            results = self._results(*self._rank(normalize(query_embedding), n, head, top_k))
+            self._cache_results(key, results)
+            return list(results)
+
+    def _rank(self, q, n: int, head: int, top_k: int):
+        """(slots des top_k meilleurs, scores indexables par slot) pour une requête
+        normalisée (appeler avec _lock)."""
+        if self._matrix_i8 is not None:
+            # Pré-sélection sur int8, puis score exact des seuls candidats
+            cand = np.asarray(top_k_indices(self._score_i8(n, q), top_k * QUANT_RERANK, head))
+            cand = cand[np.argsort((cand - head) % n, kind="stable")]
+            exact = self._matrix[cand] @ q
+            picked = top_k_indices(exact, top_k)
+            order = cand[picked].tolist()
+            return order, dict(zip(order, exact[picked].tolist()))
+        if np is not None:
+            # Un seul passage sur toutes les lignes
+            scores = self._scan(self._matrix[:n], q)
+            return top_k_indices(scores, top_k, head), scores.tolist()
+        scores = [sum(x * y for x, y in zip(q, row)) for row in self._matrix]
+        return heapq.nlargest(top_k, self._slots(), key=scores.__getitem__), scores
+
+    def _results(self, order: List[int], scores) -> List[Dict]:
+        meta = self._meta
+        return [{
+            "id": meta[i]["id"],
+            "text": meta[i]["text"][:500],
+            "score": round(scores[i], 4),
+            "metadata": meta[i].get("metadata", {}),
+            "timestamp": meta[i].get("timestamp")
+        } for i in order]
+
+    def _cache_results(self, key: tuple, results: List[Dict]):
+        self._search_cache[key] = (time.monotonic(), results)
+        if len(self._search_cache) > SEARCH_CACHE_SIZE:
+            self._search_cache.popitem(last=False)
+
+    def _scan(self, mat, q):
+        """score_rows() sur toutes les lignes, découpé en blocs sur le pool de threads
+        (BLAS / SimSIMD relâchent le GIL). Le noyau numba est déjà parallèle."""
+        n = len(mat)
+        if SEARCH_THREADS < 2 or n < PARALLEL_MIN_ROWS or (_score_all is not None and _simd is None):
+            return score_rows(mat, q)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix="vs-search")
+        step = -(-n // SEARCH_THREADS)
+        return np.concatenate(list(self._pool.map(
+            lambda i: score_rows(mat[i:i + step], q), range(0, n, step)
+        )))
+
+    def _score_i8(self, n: int, q):
+        """Scores cosine approchés des n premières lignes via la copie int8."""
+        q8, q_scale = quantize_i8(q)
+        return self._scan(self._matrix_i8[:n], q8) * (self._inv_scales[:n] / q_scale)
 
     def stats(self) -> Dict:
         """Statistiques du store."""
         return {
-            "total_entries": len(self.entries),
+            "total_entries": self._n,
             "max_entries": MAX_ENTRIES,
             "embed_model": self.embed_model,
-            "store_path": self.store_path,
-            "total_text_chars": sum(e.get("text_length", 0) for e in self.entries),
-            "oldest": self.entries[0]["timestamp"] if self.entries else None,
-            "newest": self.entries[-1]["timestamp"] if self.entries else None
+            "vectors_path": self._vec_path,
+            "metadata_path": self._meta_path,
+            "lock_path": self._lock_path,
+            "total_text_chars": self._total_chars,
+            "oldest": self._meta[self._head]["timestamp"] if self._meta else None,
+            "newest": self._meta[self._head - 1]["timestamp"] if self._meta else None
         }